@@ -1,4 +1,5 @@
 from logging.config import fileConfig
+from urllib.parse import quote_plus
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -14,10 +15,12 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# Skipped when run from the app, which has its own logging set up.
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
     fileConfig(config.config_file_name)
+# configparser treats % as interpolation, so escape it after URL-quoting
 config.set_main_option(
-    "sqlalchemy.url", f'postgresql+psycopg2://{settings.database_username}:Daku408%%40@{settings.database_hostname}:{settings.database_port}/{settings.database_name}')
+    "sqlalchemy.url", f'postgresql+psycopg2://{settings.database_username}:{quote_plus(settings.database_password).replace("%", "%%")}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}')
 
 
 # add your model's MetaData object here
@@ -63,6 +66,17 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # app.migrations passes in a connection that already holds the migration lock
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(
+            connection=connection, target_metadata=target_metadata
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
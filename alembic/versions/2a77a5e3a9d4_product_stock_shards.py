@@ -0,0 +1,41 @@
+"""product stock shards
+
+Revision ID: 2a77a5e3a9d4
+Revises: 2cdde2d545fe
+Create Date: 2026-10-18 18:05:12.304117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2a77a5e3a9d4'
+down_revision: Union[str, None] = '2cdde2d545fe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('stock_shards', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.create_table('product_stock_shards',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('stock', sa.Integer(), nullable=False),
+        sa.CheckConstraint('stock >= 0', name='check_shard_stock_non_negative'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    # Fold any sharded stock back into the product rows first
+    op.execute(
+        "UPDATE products SET stock = products.stock + totals.stock "
+        "FROM (SELECT product_id, sum(stock) AS stock FROM product_stock_shards GROUP BY product_id) AS totals "
+        "WHERE products.id = totals.product_id"
+    )
+    op.drop_table('product_stock_shards')
+    op.drop_column('products', 'stock_shards')
@@ -0,0 +1,48 @@
+"""stock reservations
+
+Revision ID: 2cdde2d545fe
+Revises: 4d47c3db0944
+Create Date: 2026-10-18 16:12:40.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2cdde2d545fe'
+down_revision: Union[str, None] = '4d47c3db0944'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # With a constant default this is a catalog-only change, no table rewrite
+    op.add_column('products', sa.Column('reserved_stock', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.create_check_constraint('check_reserved_stock_non_negative', 'products', 'reserved_stock >= 0')
+    op.create_table('stock_reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cart_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.CheckConstraint('quantity > 0', name='check_reservation_quantity_positive'),
+        sa.ForeignKeyConstraint(['cart_id'], ['carts.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cart_id', 'product_id', name='uq_stock_reservations_cart_id_product_id')
+    )
+    op.create_index(op.f('ix_stock_reservations_id'), 'stock_reservations', ['id'], unique=False)
+    op.create_index(op.f('ix_stock_reservations_product_id'), 'stock_reservations', ['product_id'], unique=False)
+    op.create_index(op.f('ix_stock_reservations_expires_at'), 'stock_reservations', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stock_reservations_expires_at'), table_name='stock_reservations')
+    op.drop_index(op.f('ix_stock_reservations_product_id'), table_name='stock_reservations')
+    op.drop_index(op.f('ix_stock_reservations_id'), table_name='stock_reservations')
+    op.drop_table('stock_reservations')
+    op.drop_constraint('check_reserved_stock_non_negative', 'products', type_='check')
+    op.drop_column('products', 'reserved_stock')
@@ -0,0 +1,54 @@
+"""unique cart item per product
+
+Revision ID: 4d47c3db0944
+Revises: c5da86e21464
+Create Date: 2026-10-18 14:06:51.270113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d47c3db0944'
+down_revision: Union[str, None] = 'c5da86e21464'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Fold duplicate lines into the oldest one before the constraint goes on
+    op.execute("""
+        WITH merged AS (
+            SELECT min(id) AS keep_id, cart_id, product_id, sum(quantity) AS quantity
+            FROM cart_items
+            GROUP BY cart_id, product_id
+            HAVING count(*) > 1
+        ), kept AS (
+            UPDATE cart_items SET quantity = merged.quantity
+            FROM merged
+            WHERE cart_items.id = merged.keep_id
+        )
+        DELETE FROM cart_items
+        USING merged
+        WHERE cart_items.cart_id = merged.cart_id
+          AND cart_items.product_id = merged.product_id
+          AND cart_items.id <> merged.keep_id
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('uq_cart_items_cart_id_product_id', 'cart_items', ['cart_id', 'product_id'],
+                        unique=True, postgresql_concurrently=True, if_not_exists=True)
+        op.execute("ALTER TABLE cart_items ADD CONSTRAINT uq_cart_items_cart_id_product_id "
+                   "UNIQUE USING INDEX uq_cart_items_cart_id_product_id")
+        # The unique index covers the same lookups
+        op.drop_index('ix_cart_items_cart_id_product_id', table_name='cart_items',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_cart_items_cart_id_product_id', 'cart_items', ['cart_id', 'product_id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+    op.drop_constraint('uq_cart_items_cart_id_product_id', 'cart_items', type_='unique')
@@ -0,0 +1,43 @@
+"""index hot query columns
+
+Revision ID: c5da86e21464
+Revises: d838f588b5ed
+Create Date: 2026-10-18 12:41:05.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5da86e21464'
+down_revision: Union[str, None] = 'd838f588b5ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_cart_items_cart_id_product_id', 'cart_items', ['cart_id', 'product_id']),
+    ('ix_order_items_order_id', 'order_items', ['order_id']),
+    ('ix_order_items_product_id', 'order_items', ['product_id']),
+    ('ix_products_owner_id', 'products', ['owner_id']),
+    ('ix_orders_user_id', 'orders', ['user_id']),
+    ('ix_shipping_addresses_user_id', 'shipping_addresses', ['user_id']),
+    ('ix_products_is_active_id', 'products', ['is_active', 'id']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction. If it is
+    # interrupted it leaves an INVALID index behind; drop it and rerun.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
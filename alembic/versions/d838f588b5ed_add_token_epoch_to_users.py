@@ -0,0 +1,26 @@
+"""add token epoch to users
+
+Revision ID: d838f588b5ed
+Revises: f91a12c86a76
+Create Date: 2026-10-18 10:02:17.384920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd838f588b5ed'
+down_revision: Union[str, None] = 'f91a12c86a76'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_epoch', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_epoch')
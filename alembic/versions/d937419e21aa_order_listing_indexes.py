@@ -0,0 +1,28 @@
+"""order listing indexes
+
+Revision ID: d937419e21aa
+Revises: ed26be0c28ab
+Create Date: 2026-10-18 19:48:03.517902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd937419e21aa'
+down_revision: Union[str, None] = 'ed26be0c28ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_orders_user_id_created_at_id', 'orders', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_orders_created_at_id', 'orders', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_created_at_id', table_name='orders')
+    op.drop_index('ix_orders_user_id_created_at_id', table_name='orders')
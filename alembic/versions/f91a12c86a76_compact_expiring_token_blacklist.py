@@ -0,0 +1,60 @@
+"""compact expiring token blacklist
+
+Revision ID: f91a12c86a76
+Revises: e1f33308f771
+Create Date: 2026-10-18 09:12:40.511203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f91a12c86a76'
+down_revision: Union[str, None] = 'e1f33308f771'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('token_blacklist', sa.Column('token_key', sa.String(length=64), nullable=True))
+    op.add_column('token_blacklist', sa.Column('expiry_bucket', sa.Integer(), nullable=True))
+
+    # Expired entries can no longer be replayed and rows without an expiry
+    # can't be bucketed, so neither is carried over.
+    op.execute("DELETE FROM token_blacklist WHERE expiry_time IS NULL OR expiry_time <= timezone('utc', now())")
+
+    # Tokens issued before this revision have no jti claim, so they are keyed
+    # by the SHA-256 digest of the encoded token (see revocation.token_key).
+    op.execute("""
+        UPDATE token_blacklist
+        SET token_key = encode(sha256(convert_to(token, 'UTF8')), 'hex'),
+            expiry_bucket = floor(extract(epoch FROM expiry_time) / 3600)::integer
+    """)
+
+    # Dropping the columns also drops the old primary key and token index
+    op.drop_column('token_blacklist', 'token')
+    op.drop_column('token_blacklist', 'id')
+    op.alter_column('token_blacklist', 'token_key', nullable=False)
+    op.alter_column('token_blacklist', 'expiry_bucket', nullable=False)
+    op.alter_column('token_blacklist', 'expiry_time', existing_type=sa.DateTime(), nullable=False)
+    op.create_primary_key('token_blacklist_pkey', 'token_blacklist', ['token_key'])
+    op.create_index(op.f('ix_token_blacklist_expiry_bucket'), 'token_blacklist', ['expiry_bucket'], unique=False)
+    op.create_index(op.f('ix_token_blacklist_blacklisted_at'), 'token_blacklist', ['blacklisted_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Digests can't be turned back into tokens, so revocations are dropped
+    op.execute("DELETE FROM token_blacklist")
+    op.drop_index(op.f('ix_token_blacklist_blacklisted_at'), table_name='token_blacklist')
+    op.drop_index(op.f('ix_token_blacklist_expiry_bucket'), table_name='token_blacklist')
+    op.drop_constraint('token_blacklist_pkey', 'token_blacklist', type_='primary')
+    op.alter_column('token_blacklist', 'expiry_time', existing_type=sa.DateTime(), nullable=True)
+    op.drop_column('token_blacklist', 'expiry_bucket')
+    op.drop_column('token_blacklist', 'token_key')
+    op.execute("ALTER TABLE token_blacklist ADD COLUMN id SERIAL PRIMARY KEY")
+    op.add_column('token_blacklist', sa.Column('token', sa.String(), nullable=True))
+    op.create_index(op.f('ix_token_blacklist_id'), 'token_blacklist', ['id'], unique=False)
+    op.create_index(op.f('ix_token_blacklist_token'), 'token_blacklist', ['token'], unique=True)
@@ -0,0 +1,356 @@
+"""
+Cart backends.
+
+SqlCartStore is the default and runs every cart edit straight against
+carts/cart_items. RedisCartStore keeps live carts in Redis and writes them
+back to Postgres behind the request: a background job flushes the carts
+edited since the last run, and checkout flushes the user's cart before the
+order is built from it.
+
+In Redis a cart is two keys, `cart:<user_id>:id` (the carts row id) and
+`cart:<user_id>:items`, a hash of product_id -> quantity. A cart line has
+no row of its own until it is flushed, so its id in the API is its
+product_id. Stock is still read from Postgres on every edit, and with
+reservations on, each edit updates the cart's holds in Postgres before
+Redis takes it.
+"""
+import redis
+from fastapi import HTTPException
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, selectinload
+
+from . import crud, models, schemas
+from .config import settings
+
+DIRTY_KEY = "carts:dirty"
+FLUSH_BATCH = 500
+
+
+class SqlCartStore:
+    def get_cart(self, db: Session, user_id: int):
+        return crud.get_cart(db, user_id=user_id)
+
+    def get_expanded_cart(self, db: Session, user_id: int):
+        return crud.get_expanded_cart(db, user_id=user_id)
+
+    def add_item(self, db: Session, item: schemas.CartItemCreate, user_id: int):
+        return crud.add_item_to_cart(db=db, item=item, user_id=user_id)
+
+    def update_item(self, db: Session, item_id: int, item: schemas.CartItemUpdate, user_id: int):
+        return crud.update_cart_item(db=db, item_id=item_id, item=item, user_id=user_id)
+
+    def remove_item(self, db: Session, item_id: int, user_id: int):
+        return crud.remove_item_from_cart(db=db, item_id=item_id, user_id=user_id)
+
+    def clear(self, db: Session, user_id: int):
+        return crud.clear_cart(db=db, user_id=user_id)
+
+    def apply_batch(self, db: Session, operations: list, user_id: int):
+        return crud.apply_cart_batch(db=db, operations=operations, user_id=user_id)
+
+    def get_total(self, db: Session, user_id: int):
+        return crud.get_cart_total(db=db, user_id=user_id)
+
+    def merge_guest_cart(self, db: Session, user_id: int, lines: dict):
+        return crud.merge_guest_cart(db=db, user_id=user_id, lines=lines)
+
+    def persist(self, db: Session, user_id: int):
+        # Already in Postgres
+        pass
+
+    def checked_out(self, db: Session, user_id: int):
+        # crud.create_order removed the ordered lines in its own transaction
+        pass
+
+    def flush_dirty(self, db: Session):
+        return 0
+
+
+class RedisCartStore:
+    def __init__(self, client, ttl_seconds: float = 7 * 24 * 3600):
+        self.client = client
+        self.ttl_seconds = int(ttl_seconds)
+
+    @staticmethod
+    def _keys(user_id: int):
+        return f"cart:{user_id}:id", f"cart:{user_id}:items"
+
+    def _load(self, db: Session, user_id: int, create: bool):
+        """Return the user's cart id, copying the cart from Postgres on a miss."""
+        id_key, items_key = self._keys(user_id)
+        cart_id = self.client.get(id_key)
+        if cart_id is not None:
+            return int(cart_id)
+
+        db_cart = db.query(models.Cart).options(selectinload(models.Cart.items)).filter(
+            models.Cart.user_id == user_id).first()
+        if db_cart is None:
+            if not create:
+                return None
+            cart_id, items = db.scalar(crud.upsert_cart(user_id)), {}
+            db.commit()
+        else:
+            cart_id, items = db_cart.id, {item.product_id: item.quantity for item in db_cart.items}
+
+        def fill(pipe):
+            # Another request may have loaded it meanwhile, and edited it since
+            if pipe.exists(id_key):
+                return
+            pipe.multi()
+            pipe.delete(items_key)
+            if items:
+                pipe.hset(items_key, mapping=items)
+                pipe.expire(items_key, self.ttl_seconds)
+            pipe.set(id_key, cart_id, ex=self.ttl_seconds)
+
+        self.client.transaction(fill, id_key)
+        return int(self.client.get(id_key))
+
+    def _lines(self, user_id: int):
+        _, items_key = self._keys(user_id)
+        return {int(product_id): int(quantity) for product_id, quantity in self.client.hgetall(items_key).items()}
+
+    def _mutate(self, db: Session, user_id: int, product_ids, apply, create: bool = True, reserve: bool = True):
+        """
+        Run apply(lines, stock) -> new lines atomically against the Redis
+        cart and mark it dirty. `stock` holds what the cart may have of
+        `product_ids`, read once up front; apply raises HTTPException to
+        refuse the edit. With reservations on (and `reserve`), the changed
+        lines are reserved like crud.reserve_stock does for the SQL cart.
+        """
+        cart_id = self._load(db, user_id, create=create)
+        if cart_id is None:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        stock = {}
+        if product_ids:
+            stock = dict(db.execute(
+                select(models.Product.id, crud.available_to_cart(cart_id)).where(models.Product.id.in_(product_ids))
+            ).all())
+        id_key, items_key = self._keys(user_id)
+        reserve = reserve and crud.reservations_enabled()
+
+        def edit(pipe):
+            lines = {int(product_id): int(quantity) for product_id, quantity in pipe.hgetall(items_key).items()}
+            updated = apply(dict(lines), stock)
+            if reserve:
+                # Held before Redis takes the edit; if a concurrent edit
+                # makes Redis retry, the holds start over from its lines
+                db.rollback()
+                try:
+                    crud.reserve_stock(db, cart_id, {
+                        product_id: updated.get(product_id, 0)
+                        for product_id in lines.keys() | updated.keys()
+                        if lines.get(product_id) != updated.get(product_id)
+                    })
+                except HTTPException:
+                    db.rollback()
+                    raise
+            pipe.multi()
+            removed = [product_id for product_id in lines if product_id not in updated]
+            changed = {product_id: quantity for product_id, quantity in updated.items() if lines.get(product_id) != quantity}
+            if removed:
+                pipe.hdel(items_key, *removed)
+            if changed:
+                pipe.hset(items_key, mapping=changed)
+            pipe.expire(items_key, self.ttl_seconds)
+            pipe.expire(id_key, self.ttl_seconds)
+            pipe.sadd(DIRTY_KEY, user_id)
+            return updated
+
+        lines = self.client.transaction(edit, items_key, value_from_callable=True)
+        if reserve:
+            db.commit()
+        return cart_id, lines
+
+    def get_cart(self, db: Session, user_id: int):
+        cart_id = self._load(db, user_id, create=False)
+        if cart_id is None:
+            return None
+        items = [
+            schemas.CartItem(id=product_id, product_id=product_id, quantity=quantity)
+            for product_id, quantity in sorted(self._lines(user_id).items())
+        ]
+        return schemas.Cart(id=cart_id, user_id=user_id, items=items)
+
+    def _products(self, db: Session, lines: dict):
+        if not lines:
+            return []
+        products = db.query(models.Product).filter(models.Product.id.in_(lines)).all()
+        return sorted(products, key=lambda product: product.id)
+
+    def get_expanded_cart(self, db: Session, user_id: int):
+        cart_id = self._load(db, user_id, create=False)
+        if cart_id is None:
+            return None
+        lines = self._lines(user_id)
+        return crud.expanded_cart(cart_id, user_id, [
+            (product.id, lines[product.id], product) for product in self._products(db, lines)
+        ])
+
+    def get_total(self, db: Session, user_id: int):
+        if self._load(db, user_id, create=False) is None:
+            return schemas.CartTotal(total=0, items_count=0)
+        lines = self._lines(user_id)
+        total = sum(
+            crud.calculate_discounted_price(product_price=product.price, discount=product.discount_price) * lines[product.id]
+            for product in self._products(db, lines)
+        )
+        return schemas.CartTotal(total=round(total, 2), items_count=sum(lines.values()))
+
+    def add_item(self, db: Session, item: schemas.CartItemCreate, user_id: int):
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
+
+        def add(lines, stock):
+            if item.product_id not in stock:
+                raise HTTPException(status_code=404, detail="Product not found")
+            if item.quantity > stock[item.product_id]:
+                raise HTTPException(status_code=400, detail="Not enough stock available")
+            lines[item.product_id] = lines.get(item.product_id, 0) + item.quantity
+            if lines[item.product_id] > stock[item.product_id]:
+                raise HTTPException(status_code=400, detail="Not enough stock for the total quantity")
+            return lines
+
+        _, lines = self._mutate(db, user_id, [item.product_id], add)
+        return schemas.CartItem(id=item.product_id, product_id=item.product_id, quantity=lines[item.product_id])
+
+    def update_item(self, db: Session, item_id: int, item: schemas.CartItemUpdate, user_id: int):
+        def update(lines, stock):
+            if item_id not in lines:
+                raise HTTPException(status_code=404, detail="Item not found in cart")
+            if item.quantity <= 0:
+                raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
+            if item.quantity > stock.get(item_id, 0):
+                raise HTTPException(status_code=400, detail="Not enough stock available")
+            lines[item_id] = item.quantity
+            return lines
+
+        self._mutate(db, user_id, [item_id], update, create=False)
+        return schemas.CartItem(id=item_id, product_id=item_id, quantity=item.quantity)
+
+    def remove_item(self, db: Session, item_id: int, user_id: int):
+        def remove(lines, stock):
+            if lines.pop(item_id, None) is None:
+                raise HTTPException(status_code=404, detail="Item not found in cart")
+            return lines
+
+        self._mutate(db, user_id, [], remove, create=False)
+        return {"ok": True}
+
+    def clear(self, db: Session, user_id: int):
+        self._mutate(db, user_id, [], lambda lines, stock: {}, create=False)
+        return {"ok": True}
+
+    def apply_batch(self, db: Session, operations: list, user_id: int):
+        plan = crud.fold_cart_operations(operations)
+
+        def apply(lines, stock):
+            missing = sorted(product_id for product_id in plan if product_id not in stock)
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Product not found: {missing}")
+            final = {
+                product_id: quantity + (0 if absolute else lines.get(product_id, 0))
+                for product_id, (absolute, quantity) in plan.items()
+            }
+            short = sorted(product_id for product_id, quantity in final.items() if quantity > stock[product_id])
+            if short:
+                raise HTTPException(status_code=400, detail=f"Not enough stock available for products: {short}")
+            lines.update(final)
+            return {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+
+        cart_id, lines = self._mutate(db, user_id, list(plan), apply)
+        items = [
+            schemas.CartItem(id=product_id, product_id=product_id, quantity=quantity)
+            for product_id, quantity in sorted(lines.items())
+        ]
+        return schemas.Cart(id=cart_id, user_id=user_id, items=items)
+
+    def merge_guest_cart(self, db: Session, user_id: int, lines: dict):
+        # Same rules as crud.merge_guest_cart; `stock` is already net of other carts' holds
+        def merge(current, stock):
+            for product_id, quantity in lines.items():
+                if stock.get(product_id, 0) > 0 and quantity > 0:
+                    existing = current.get(product_id, 0)
+                    current[product_id] = max(existing, min(existing + quantity, stock[product_id]))
+            return current
+
+        if lines:
+            self._mutate(db, user_id, list(lines), merge)
+
+    def checked_out(self, db: Session, user_id: int):
+        # crud.create_order already released the cart's holds
+        self._mutate(db, user_id, [], lambda lines, stock: {}, create=False, reserve=False)
+
+    def persist(self, db: Session, user_id: int):
+        self._flush(db, [user_id])
+
+    def flush_dirty(self, db: Session):
+        """Write every cart edited since the last flush back to Postgres."""
+        flushed = 0
+        while True:
+            user_ids = self.client.spop(DIRTY_KEY, FLUSH_BATCH)
+            if not user_ids:
+                return flushed
+            flushed += self._flush(db, [int(user_id) for user_id in user_ids])
+
+    def _flush(self, db: Session, user_ids: list):
+        # Unmark first: an edit that lands while this runs marks the cart
+        # dirty again, so it is picked up by the next flush
+        self.client.srem(DIRTY_KEY, *user_ids)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            id_key, items_key = self._keys(user_id)
+            pipe.get(id_key)
+            pipe.hgetall(items_key)
+        replies = pipe.execute()
+
+        carts = {}
+        for cart_id, items in zip(replies[::2], replies[1::2]):
+            # Expired since it was marked dirty; nothing left to write
+            if cart_id is not None:
+                carts[int(cart_id)] = {int(product_id): int(quantity) for product_id, quantity in items.items()}
+        if not carts:
+            return 0
+
+        try:
+            product_ids = {product_id for items in carts.values() for product_id in items}
+            # Products deleted since they were added can't be written back
+            existing = set(db.scalars(select(models.Product.id).where(models.Product.id.in_(product_ids)))) if product_ids else set()
+            lines = [
+                {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+                for cart_id, items in carts.items()
+                for product_id, quantity in items.items()
+                if product_id in existing
+            ]
+            stale = delete(models.CartItem).where(models.CartItem.cart_id.in_(carts))
+            if lines:
+                stale = stale.where(tuple_(models.CartItem.cart_id, models.CartItem.product_id).not_in(
+                    [(line["cart_id"], line["product_id"]) for line in lines]))
+            db.execute(stale)
+            if lines:
+                line_insert = insert(models.CartItem).values(lines)
+                db.execute(line_insert.on_conflict_do_update(
+                    constraint="uq_cart_items_cart_id_product_id",
+                    set_={"quantity": line_insert.excluded.quantity},
+                ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.client.sadd(DIRTY_KEY, *user_ids)
+            raise
+        return len(carts)
+
+
+def make_cart_store():
+    if settings.cart_backend == "redis":
+        client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
+        return RedisCartStore(client, ttl_seconds=settings.cart_ttl_seconds)
+    return SqlCartStore()
+
+
+cart_store = make_cart_store()
+
+
+def get_cart_store():
+    return cart_store
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Literal
 
 
 class Settings(BaseSettings):
@@ -11,6 +12,81 @@ class Settings(BaseSettings):
     algorithm: str
     access_token_expire_minutes: int
 
+    # Connection pool; applies to the sync and async engines alike
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30
+    database_pool_recycle: int = 1800
+    database_pool_pre_ping: bool = True
+
+    # What to do about the schema at startup: "none", "check" (compare the
+    # Alembic revision), "migrate" (alembic upgrade head) or "create" (create_all)
+    schema_startup_mode: Literal["none", "check", "migrate", "create"] = "check"
+
+    # Comma-separated replica URLs for read-only routes; empty reads from the primary
+    database_replica_urls: str = ""
+    # Keep a user's reads on the primary for this long after they write; 0 disables
+    read_your_writes_seconds: float = 5
+
+    # Serve the product and order routes from the asyncpg-backed async routers
+    database_async: bool = False
+
+    # "redis" keeps live carts in Redis and writes them back to Postgres every
+    # cart_flush_interval_seconds and at checkout; "sql" writes every edit through
+    cart_backend: Literal["sql", "redis"] = "sql"
+    redis_url: str = "redis://localhost:6379/0"
+    cart_flush_interval_seconds: float = 5
+    cart_ttl_seconds: float = 7 * 24 * 3600
+
+    # Hold stock for this long when it's added to a cart (SQL cart backend);
+    # 0 disables reservations. Expired holds are swept every interval.
+    stock_reservation_minutes: float = 0
+    stock_reservation_sweep_interval_seconds: float = 60
+
+    # Sharded products' stock shards are evened out this often
+    stock_shard_rebalance_interval_seconds: float = 10
+
+    # Responses to POST /orders/ sent with an Idempotency-Key are replayed for this long
+    idempotency_key_ttl_hours: float = 24
+    idempotency_key_purge_interval_seconds: float = 600
+
+    # Guest carts live in a signed cookie and are merged into the user's cart at login
+    guest_cart_max_age_seconds: float = 30 * 24 * 3600
+
+    # "blacklist" stores one row per logged-out token; "epoch" bumps a per-user
+    # counter on logout, revoking all of the user's tokens. Other workers see an
+    # epoch bump once their cached principal expires (principal_cache_ttl_seconds).
+    token_revocation_mode: Literal["blacklist", "epoch"] = "blacklist"
+    token_revocation_filter: bool = True
+    revocation_filter_capacity: int = 100000
+    revocation_filter_error_rate: float = 0.001
+    revocation_filter_refresh_seconds: float = 5
+    token_blacklist_purge_interval_seconds: float = 600
+
+    principal_cache_size: int = 10000
+    principal_cache_ttl_seconds: float = 30
+
+    # 0 means one worker per CPU
+    password_hash_workers: int = 0
+    password_hash_queue_size: int = 32
+
+    # Adds per-request query count / DB time headers and logs N+1 candidates
+    debug: bool = False
+    n_plus_one_threshold: int = 5
+
+    # Statements slower than this are recorded; 0 disables the recorder. A
+    # sample of slow SELECTs is re-run under EXPLAIN (ANALYZE, BUFFERS).
+    slow_query_ms: float = 500
+    slow_query_history: int = 200
+    slow_query_explain_sample_rate: float = 0.1
+    slow_query_explains_per_minute: int = 6
+    # Also append slow queries as JSON lines to this (rotating) file
+    slow_query_log_file: str = ""
+
+    loop_lag_monitor_enabled: bool = True
+    loop_lag_probe_interval_ms: float = 100
+    loop_lag_threshold_ms: float = 250
+
     class Config:
         env_file = ".env"
 
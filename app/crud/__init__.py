@@ -2,4 +2,7 @@ from .product import *
 from .order import *
 from .cart import *
 from .user import *
-from .address import *
\ No newline at end of file
+from .address import *
+from .reservation import *
+from .inventory import *
+from .idempotency import *
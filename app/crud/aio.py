@@ -0,0 +1,63 @@
+"""
+Async counterparts of the crud functions, for use with an AsyncSession.
+
+They run the synchronous implementations through AsyncSession.run_sync,
+which drives the same ORM code over the asyncpg connection from a
+greenlet rather than a thread. Results are converted to `schema` before
+leaving the greenlet, so serialization never triggers a lazy load on the
+event loop.
+"""
+from functools import lru_cache
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import schemas
+from . import address, cart, order, product, user
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema):
+    return TypeAdapter(schema)
+
+
+async def run(db: AsyncSession, fn, schema=None, **kwargs):
+    """Call `fn(db=<sync session>, **kwargs)` on the async session's connection."""
+    def call(session):
+        result = fn(db=session, **kwargs)
+        if schema is None or result is None:
+            return result
+        return _adapter(schema).validate_python(result, from_attributes=True)
+    return await db.run_sync(call)
+
+
+def _counterpart(fn, schema=None):
+    async def wrapper(db: AsyncSession, **kwargs):
+        return await run(db, fn, schema=schema, **kwargs)
+    wrapper.__name__ = fn.__name__
+    wrapper.__qualname__ = fn.__qualname__
+    wrapper.__doc__ = f"Async counterpart of crud.{fn.__name__}."
+    return wrapper
+
+
+get_product = _counterpart(product.get_product, schemas.Product)
+get_products = _counterpart(product.get_products, List[schemas.Product])
+search_products = _counterpart(product.search_products, List[schemas.Product])
+create_product = _counterpart(product.create_product, schemas.Product)
+
+get_user_by_emailphone = _counterpart(user.get_user_by_emailphone, schemas.User)
+create_user = _counterpart(user.create_user, schemas.User)
+
+get_cart = _counterpart(cart.get_cart, schemas.Cart)
+clear_cart = _counterpart(cart.clear_cart)
+get_shipping_address = _counterpart(address.get_shipping_address, schemas.ShippingAddress)
+
+create_order = _counterpart(order.create_order, schemas.Order)
+get_order = _counterpart(order.get_order, schemas.Order)
+update_order_status = _counterpart(order.update_order_status, schemas.Order)
+cancel_order = _counterpart(order.cancel_order, schemas.Order)
+get_user_orders = _counterpart(order.get_user_orders, List[schemas.Order])
+get_seller_orders = _counterpart(order.get_seller_orders, List[schemas.Order])
+get_all_orders = _counterpart(order.get_all_orders, List[schemas.Order])
+is_seller_related_to_order = _counterpart(order.is_seller_related_to_order)
@@ -1,61 +1,87 @@
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext 
+from sqlalchemy import Boolean, Integer, case, column, func, literal, literal_column, select, true, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, selectinload
    
 from .. import models, schemas
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .order import calculate_discounted_price, discounted_price_expression
+from .reservation import release_cart_reservations, reservations_enabled, reserve_stock
 
 def get_cart(db: Session, user_id: int):
     return db.query(models.Cart).filter(models.Cart.user_id == user_id).first()
 
 
+def upsert_cart(user_id: int):
+    """
+    INSERT ... RETURNING id for the user's cart, creating it if needed. The
+    no-op update makes RETURNING yield an existing row too, is safe against a
+    concurrent first add, and locks the cart row until the transaction ends.
+    """
+    cart_insert = insert(models.Cart).values(user_id=user_id)
+    return cart_insert.on_conflict_do_update(
+        index_elements=[models.Cart.user_id], set_={"user_id": cart_insert.excluded.user_id}
+    ).returning(models.Cart.id)
+
+
 def add_item_to_cart(db: Session, item: schemas.CartItemCreate, user_id: int):
-    # Check if the product exists and has enough stock
-    product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
     if item.quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
-    
-    if product.stock < item.quantity:
-        raise HTTPException(status_code=400, detail="Not enough stock available")
 
-    # Get or create the user's cart
-    db_cart = get_cart(db, user_id)
-    if not db_cart:
-        db_cart = models.Cart(user_id=user_id)
-        db.add(db_cart)
-        db.commit()
+    cart = upsert_cart(user_id).cte("cart")
 
-    # Check if the item already exists in the cart
-    existing_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == db_cart.id,
-        models.CartItem.product_id == item.product_id
-    ).first()
-
-    if existing_item:
-        # Update quantity if item already exists
-        new_quantity = existing_item.quantity + item.quantity
-        if new_quantity > product.stock:
-            raise HTTPException(status_code=400, detail="Not enough stock for the total quantity")
-        existing_item.quantity = new_quantity
-        db_item = existing_item
-    else:
-        # Add new item to cart
-        db_item = models.CartItem(cart_id=db_cart.id, product_id=item.product_id, quantity=item.quantity)
-        db.add(db_item)
+    # Add the line or increase its quantity, as long as stock covers the new total
+    line_insert = insert(models.CartItem).from_select(
+        ["cart_id", "product_id", "quantity"],
+        select(cart.c.id, models.Product.id, literal(item.quantity))
+        .select_from(cart)
+        .join(models.Product, true())
+        .where(
+            models.Product.id == item.product_id,
+            models.Product.total_stock >= item.quantity,
+        ),
+    )
+    stock = select(models.Product.total_stock).where(models.Product.id == item.product_id).scalar_subquery()
+    new_quantity = models.CartItem.quantity + line_insert.excluded.quantity
+    stmt = line_insert.on_conflict_do_update(
+        constraint="uq_cart_items_cart_id_product_id",
+        set_={"quantity": new_quantity},
+        where=new_quantity <= stock,
+    ).returning(models.CartItem)
 
+    db_item = db.scalars(stmt, execution_options={"populate_existing": True}).first()
+    if db_item is None:
+        db.rollback()
+        raise _add_item_error(db, item, user_id)
+    if reservations_enabled():
+        try:
+            reserve_stock(db, db_item.cart_id, {item.product_id: db_item.quantity})
+        except HTTPException:
+            db.rollback()
+            raise
     try:
         db.commit()
-        db.refresh(db_item)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="An error occurred while adding item to cart")
 
     return db_item
 
+def _add_item_error(db: Session, item: schemas.CartItemCreate, user_id: int):
+    # Only reached when the upsert was refused, to pick the right message
+    product_stock, existing_quantity = db.execute(
+        select(
+            select(models.Product.total_stock).where(models.Product.id == item.product_id).scalar_subquery(),
+            select(models.CartItem.quantity).join(models.Cart).where(
+                models.Cart.user_id == user_id, models.CartItem.product_id == item.product_id
+            ).scalar_subquery(),
+        )
+    ).one()
+    if product_stock is None:
+        return HTTPException(status_code=404, detail="Product not found")
+    if existing_quantity is not None and product_stock >= item.quantity:
+        return HTTPException(status_code=400, detail="Not enough stock for the total quantity")
+    return HTTPException(status_code=400, detail="Not enough stock available")
+
 def remove_item_from_cart(db: Session, item_id: int, user_id: int):
     db_cart = get_cart(db, user_id)
     if not db_cart:
@@ -65,6 +91,8 @@ def remove_item_from_cart(db: Session, item_id: int, user_id: int):
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found in cart")
 
+    if reservations_enabled():
+        reserve_stock(db, db_cart.id, {db_item.product_id: 0})
     db.delete(db_item)
     db.commit()
     return {"ok": True}
@@ -82,8 +110,14 @@ def update_cart_item(db: Session, item_id: int, item: schemas.CartItemCreate, us
         raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
     
     product = db.query(models.Product).filter(models.Product.id == db_item.product_id).first()
-    if not product or item.quantity > product.stock:
+    if not product or item.quantity > product.total_stock:
         raise HTTPException(status_code=400, detail="Not enough stock available")
+    if reservations_enabled():
+        try:
+            reserve_stock(db, db_cart.id, {db_item.product_id: item.quantity})
+        except HTTPException:
+            db.rollback()
+            raise
 
     db_item.quantity = item.quantity
     db.commit()
@@ -95,20 +129,187 @@ def clear_cart(db: Session, user_id: int):
     if not db_cart:
         raise HTTPException(status_code=404, detail="Cart not found")
 
+    if reservations_enabled():
+        release_cart_reservations(db, user_id)
     db.query(models.CartItem).filter(models.CartItem.cart_id == db_cart.id).delete()
     db.commit()
     return {"ok": True}
 
 
+def fold_cart_operations(operations: list):
+    """
+    Fold batch operations into {product_id: (replaces_current, quantity)}:
+    adds accumulate, and a set or remove replaces whatever came before it.
+    """
+    plan = {}
+    for op in operations:
+        absolute, quantity = plan.get(op.product_id, (False, 0))
+        if op.op == "add":
+            if op.quantity is None or op.quantity <= 0:
+                raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
+            plan[op.product_id] = (absolute, quantity + op.quantity)
+        elif op.op == "set":
+            if op.quantity is None or op.quantity < 0:
+                raise HTTPException(status_code=400, detail="Quantity cannot be negative")
+            plan[op.product_id] = (True, op.quantity)
+        else:
+            plan[op.product_id] = (True, 0)
+    return plan
+
+
+def apply_cart_batch(db: Session, operations: list, user_id: int):
+    """
+    Apply add / set / remove operations, keyed by product_id, in one
+    transaction. Operations on the same product are folded first, so the
+    database sees one final quantity per product: validated with one query,
+    then written with one delete and one upsert.
+    """
+    plan = fold_cart_operations(operations)
+    cart_id = db.scalar(upsert_cart(user_id))
+    if plan:
+        ops = values(
+            column("product_id", Integer), column("absolute", Boolean), column("quantity", Integer), name="ops"
+        ).data([(product_id, absolute, quantity) for product_id, (absolute, quantity) in plan.items()])
+        final_quantity = case(
+            (ops.c.absolute, 0), else_=func.coalesce(models.CartItem.quantity, 0)
+        ) + ops.c.quantity
+        rows = db.execute(
+            select(ops.c.product_id, models.Product.total_stock, final_quantity)
+            .select_from(ops)
+            .outerjoin(models.Product, models.Product.id == ops.c.product_id)
+            .outerjoin(models.CartItem, (models.CartItem.cart_id == cart_id) & (models.CartItem.product_id == ops.c.product_id))
+        ).all()
+
+        missing = sorted(product_id for product_id, stock, _ in rows if stock is None)
+        if missing:
+            db.rollback()
+            raise HTTPException(status_code=404, detail=f"Product not found: {missing}")
+        short = sorted(product_id for product_id, stock, quantity in rows if quantity > stock)
+        if short:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Not enough stock available for products: {short}")
+
+        if reservations_enabled():
+            try:
+                reserve_stock(db, cart_id, {product_id: quantity for product_id, _, quantity in rows})
+            except HTTPException:
+                db.rollback()
+                raise
+
+        removed = [product_id for product_id, _, quantity in rows if quantity == 0]
+        kept = [{"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+                for product_id, _, quantity in rows if quantity > 0]
+        if removed:
+            db.execute(models.CartItem.__table__.delete().where(
+                models.CartItem.cart_id == cart_id, models.CartItem.product_id.in_(removed)))
+        if kept:
+            line_insert = insert(models.CartItem).values(kept)
+            db.execute(line_insert.on_conflict_do_update(
+                constraint="uq_cart_items_cart_id_product_id",
+                set_={"quantity": line_insert.excluded.quantity},
+            ))
+    db.commit()
+
+    return db.query(models.Cart).options(selectinload(models.Cart.items)).populate_existing().filter(
+        models.Cart.id == cart_id).one()
+
+
+def merge_guest_cart(db: Session, user_id: int, lines: dict):
+    """
+    Fold guest cart lines into the user's cart with a single upsert. Each
+    line is capped at the product's stock (less what other carts hold, with
+    reservations on), but never lowers a quantity the user's cart already
+    had; unknown or sold-out products are dropped.
+    """
+    if not lines:
+        return
+    cart = upsert_cart(user_id).cte("cart")
+    guest = values(column("product_id", Integer), column("quantity", Integer), name="guest").data(list(lines.items()))
+    line_insert = insert(models.CartItem).from_select(
+        ["cart_id", "product_id", "quantity"],
+        select(cart.c.id, models.Product.id, func.least(guest.c.quantity, available_to_cart(cart.c.id)))
+        .select_from(cart)
+        .join(guest, true())
+        .join(models.Product, models.Product.id == guest.c.product_id)
+        .where(available_to_cart(cart.c.id) > 0, guest.c.quantity > 0),
+    )
+    # Correlated to the conflicting row by name; a Column reference would
+    # pull cart_items into the subquery's FROM list
+    cap = select(available_to_cart(literal_column("cart_items.cart_id"))).where(
+        models.Product.id == literal_column("cart_items.product_id")).scalar_subquery()
+    merged = db.execute(line_insert.on_conflict_do_update(
+        constraint="uq_cart_items_cart_id_product_id",
+        set_={"quantity": func.greatest(
+            models.CartItem.quantity, func.least(models.CartItem.quantity + line_insert.excluded.quantity, cap)
+        )},
+    ).returning(models.CartItem.cart_id, models.CartItem.product_id, models.CartItem.quantity)).all()
+    if merged and reservations_enabled():
+        try:
+            reserve_stock(db, merged[0].cart_id, {row.product_id: row.quantity for row in merged})
+        except HTTPException:
+            db.rollback()
+            raise
+    db.commit()
+
+
+def available_to_cart(cart_id):
+    # How much of a product the cart may hold: its stock, less what other
+    # carts reserved
+    if not reservations_enabled():
+        return models.Product.total_stock
+    held = select(models.StockReservation.quantity).where(
+        models.StockReservation.cart_id == cart_id,
+        models.StockReservation.product_id == models.Product.id,
+    ).scalar_subquery()
+    return models.Product.total_stock - models.Product.reserved_stock + func.coalesce(held, 0)
+
+
 def get_cart_total(db: Session, user_id: int):
-    db_cart = get_cart(db, user_id)
+    line_price = discounted_price_expression(models.Product.price, models.Product.discount_price)
+    total, items_count = db.execute(
+        select(
+            func.coalesce(func.sum(line_price * models.CartItem.quantity), 0),
+            func.coalesce(func.sum(models.CartItem.quantity), 0),
+        )
+        .select_from(models.CartItem)
+        .join(models.Cart)
+        .join(models.Product)
+        .where(models.Cart.user_id == user_id)
+    ).one()
+    return schemas.CartTotal(total=float(total), items_count=items_count)
+
+
+def get_expanded_cart(db: Session, user_id: int):
+    # Two queries whatever the size: the cart, then its items joined to their products
+    db_cart = db.query(models.Cart).options(
+        selectinload(models.Cart.items).joinedload(models.CartItem.product)
+    ).filter(models.Cart.user_id == user_id).first()
     if not db_cart:
-        return 0
+        return None
+
+    lines = [(item.id, item.quantity, item.product) for item in sorted(db_cart.items, key=lambda item: item.id)]
+    return expanded_cart(db_cart.id, db_cart.user_id, lines)
 
-    total = 0
-    for item in db_cart.items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if product:
-            total += product.price * item.quantity
 
-    return total
+def expanded_cart(cart_id: int, user_id: int, lines: list):
+    """Build an ExpandedCart from (line id, quantity, product) tuples."""
+    items = []
+    for line_id, quantity, product in lines:
+        sale_price = calculate_discounted_price(product_price=product.price, discount=product.discount_price)
+        items.append(schemas.ExpandedCartItem(
+            id=line_id,
+            product_id=product.id,
+            quantity=quantity,
+            name=product.name,
+            price=product.price,
+            sale_price=sale_price,
+            stock=product.total_stock,
+            image_url=product.image_url,
+            subtotal=round(sale_price * quantity, 2),
+        ))
+    return schemas.ExpandedCart(
+        id=cart_id,
+        user_id=user_id,
+        items=items,
+        total=round(sum(item.subtotal for item in items), 2),
+    )
@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+
+
+def request_hash(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(row, request_hash: str):
+    if row is None:
+        return None
+    if row.request_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key has already been used for a different request")
+    return row.response
+
+
+def _stored(db: Session, user_id: int, key: str):
+    return db.execute(
+        select(models.IdempotencyKey.request_hash, models.IdempotencyKey.response).where(
+            models.IdempotencyKey.user_id == user_id,
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.expires_at > datetime.utcnow(),
+        )
+    ).first()
+
+
+def get_idempotent_response(db: Session, user_id: int, key: str, request_hash: str):
+    """The stored response for the key, or None if it hasn't been used (or has expired)."""
+    return _replay(_stored(db, user_id, key), request_hash)
+
+
+def claim_idempotency_key(db: Session, user_id: int, key: str, request_hash: str):
+    """
+    Insert the key in the caller's transaction, which must store the
+    response (store_idempotent_response) before it commits. Returns None
+    once the key is claimed.
+
+    A concurrent request with the same key blocks on the insert until that
+    transaction ends: if it committed, its stored response is returned for
+    replay; if it rolled back, nothing happened and this request claims the
+    key instead.
+    """
+    now = datetime.utcnow()
+    claim = insert(models.IdempotencyKey).values(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        created_at=now,
+        expires_at=now + timedelta(hours=settings.idempotency_key_ttl_hours),
+    )
+    claimed = db.execute(claim.on_conflict_do_update(
+        index_elements=["user_id", "key"],
+        set_={"request_hash": claim.excluded.request_hash, "response": None,
+              "created_at": claim.excluded.created_at, "expires_at": claim.excluded.expires_at},
+        # An expired key that hasn't been purged yet is free again
+        where=models.IdempotencyKey.expires_at <= now,
+    ).returning(models.IdempotencyKey.key)).first()
+    if claimed is not None:
+        return None
+    return _replay(_stored(db, user_id, key), request_hash)
+
+
+def store_idempotent_response(db: Session, user_id: int, key: str, response: dict):
+    db.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.user_id == user_id, models.IdempotencyKey.key == key)
+        .values(response=response)
+    )
+
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    deleted = db.execute(
+        delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at <= datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return deleted
@@ -0,0 +1,246 @@
+import random
+
+from sqlalchemy import Integer, and_, case, column, delete, func, insert, select, tuple_, update, values
+from sqlalchemy.orm import Session
+
+from .. import models
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, product_id: int, available, requested: int):
+        self.product_id = product_id
+        if available is None:
+            message = f"Product with ID {product_id} does not exist."
+        else:
+            message = f"Insufficient stock for product {product_id}. Available: {available}, Requested: {requested}"
+        super().__init__(message)
+
+
+def locked_products(criterion):
+    """
+    CTE locking the matching product rows in id order. Every statement that
+    locks product rows goes through it, so two transactions touching the
+    same products can't deadlock. FOR NO KEY UPDATE, like the UPDATEs
+    themselves, so it doesn't wait on the key-share locks other checkouts'
+    order_items foreign keys hold.
+    """
+    return select(models.Product.id).where(criterion).order_by(
+        models.Product.id).with_for_update(key_share=True).cte("locked")
+
+
+def lock_products(db: Session, criterion):
+    """Lock the matching product rows for the rest of the transaction, in id order."""
+    db.execute(select(locked_products(criterion).c.id)).all()
+
+
+def decrement_stock(db: Session, quantities: dict) -> dict:
+    """
+    Take {product_id: quantity} out of stock with one guarded UPDATE.
+
+    The rows are locked in id order and only decremented where the unheld
+    stock covers the quantity, so the statement never oversells and the
+    locks are only held from here to the caller's commit; call it last.
+    Sharded products skip the product row and take from their shards
+    instead (see _take_from_shards).
+    All or nothing: if any product falls short this raises InsufficientStock
+    with nothing decremented, and the caller's transaction can carry on.
+    Returns {product_id: remaining stock}; for a sharded product, what's
+    left in the shards it took from.
+    """
+    if not quantities:
+        return {}
+    wanted = values(column("product_id", Integer), column("quantity", Integer), name="wanted").data(
+        list(quantities.items()))
+    locked = locked_products(and_(models.Product.id.in_(quantities), models.Product.stock_shards == 0))
+    remaining = dict(db.execute(
+        update(models.Product)
+        .where(models.Product.id == wanted.c.product_id,
+               models.Product.id.in_(select(locked.c.id)),
+               models.Product.stock - models.Product.reserved_stock >= wanted.c.quantity)
+        .values(stock=models.Product.stock - wanted.c.quantity)
+        .returning(models.Product.id, models.Product.stock)
+        .execution_options(synchronize_session=False)
+    ).all())
+    if len(remaining) < len(quantities):
+        # What's left is sharded, short or gone
+        taken = {product_id: quantities[product_id] for product_id in remaining}
+        missing = set(quantities) - set(remaining)
+        shards = dict(db.execute(
+            select(models.Product.id, models.Product.stock_shards)
+            .where(models.Product.id.in_(missing), models.Product.stock_shards > 0)
+        ).all())
+        short = sorted(missing - set(shards))
+        try:
+            if short:
+                available = db.execute(
+                    select(models.Product.stock - models.Product.reserved_stock).where(models.Product.id == short[0])
+                ).scalar()
+                raise InsufficientStock(short[0], available, quantities[short[0]])
+            # A savepoint, so a shard falling short undoes the shards taken before it
+            with db.begin_nested():
+                for product_id in sorted(shards):
+                    remaining[product_id] = _take_from_shards(db, product_id, quantities[product_id], shards[product_id])
+        except InsufficientStock:
+            # Hand back what the UPDATE above took
+            if taken:
+                back = values(column("product_id", Integer), column("quantity", Integer), name="back").data(
+                    list(taken.items()))
+                db.execute(
+                    update(models.Product)
+                    .where(models.Product.id == back.c.product_id)
+                    .values(stock=models.Product.stock + back.c.quantity)
+                    .execution_options(synchronize_session=False)
+                )
+            raise
+    return remaining
+
+
+def _take_from_shards(db: Session, product_id: int, quantity: int, shards: int) -> int:
+    """
+    Take `quantity` of a sharded product, preferring a single shard.
+
+    Each checkout starts looking at a random shard and skips shards other
+    checkouts have locked, so parallel buyers of a hot product mostly
+    update different rows. If no free shard covers the quantity it locks
+    all of them and takes from the fullest, draining several if no single
+    shard covers it. Reservations aren't checked here: the shards only
+    guard against selling stock that isn't there.
+    """
+    Shard = models.ProductStockShard
+    start = random.randrange(shards)
+    target = (
+        select(Shard.shard)
+        .where(Shard.product_id == product_id, Shard.stock >= quantity)
+        .order_by((Shard.shard - start + shards) % shards)
+        .limit(1)
+        .with_for_update(key_share=True, skip_locked=True)
+        .scalar_subquery()
+    )
+    left = db.execute(
+        update(Shard)
+        .where(Shard.product_id == product_id, Shard.shard == target, Shard.stock >= quantity)
+        .values(stock=Shard.stock - quantity)
+        .returning(Shard.stock)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if left is not None:
+        return left
+
+    # Locked in shard order, like the rebalancer. Waiting on a single shard
+    # instead could keep a lock on one that no longer covers the quantity
+    # and then take the others out of order
+    stocks = db.execute(
+        select(Shard.shard, Shard.stock).where(Shard.product_id == product_id)
+        .order_by(Shard.shard).with_for_update(key_share=True)
+    ).all()
+    available = sum(stock for _, stock in stocks)
+    if available < quantity:
+        raise InsufficientStock(product_id, available, quantity)
+    takes, needed = [], quantity
+    for shard, stock in sorted(stocks, key=lambda row: row.stock, reverse=True):
+        take = min(stock, needed)
+        takes.append((shard, take))
+        needed -= take
+        if not needed:
+            break
+    taken = values(column("shard", Integer), column("quantity", Integer), name="taken").data(takes)
+    db.execute(
+        update(Shard)
+        .where(Shard.product_id == product_id, Shard.shard == taken.c.shard)
+        .values(stock=Shard.stock - taken.c.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return available - quantity
+
+
+def restock_order(db: Session, order_id: int):
+    """
+    Put an order's items back into stock with one UPDATE, plus one for the
+    shards if the order has sharded products. Products are locked in id
+    order and shards in (product_id, shard) order, products first, like a
+    checkout takes them.
+    """
+    returned = select(
+        models.OrderItem.product_id, func.sum(models.OrderItem.quantity).label("quantity")
+    ).where(models.OrderItem.order_id == order_id).group_by(models.OrderItem.product_id).cte("returned")
+    locked = locked_products(models.Product.id.in_(select(returned.c.product_id)))
+    # Sharded products' rows are locked and returned too, but keep their stock
+    sharded = db.scalars(
+        update(models.Product)
+        .where(models.Product.id == returned.c.product_id, models.Product.id.in_(select(locked.c.id)))
+        .values(stock=models.Product.stock + case((models.Product.stock_shards == 0, returned.c.quantity), else_=0))
+        .returning(models.Product.stock_shards)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not any(sharded):
+        return
+    # Sharded products get their units back in one shard, picked by order id
+    Shard = models.ProductStockShard
+    target = select(Shard.product_id, Shard.shard).join(models.Product).where(
+        Shard.product_id.in_(select(returned.c.product_id)),
+        # Unsharded products have no shards, but the modulo may still see them
+        Shard.shard == order_id % func.nullif(models.Product.stock_shards, 0),
+    ).order_by(Shard.product_id, Shard.shard).with_for_update(of=Shard, key_share=True).cte("target")
+    db.execute(
+        update(Shard)
+        .where(Shard.product_id == returned.c.product_id,
+               tuple_(Shard.product_id, Shard.shard).in_(select(target.c.product_id, target.c.shard)))
+        .values(stock=Shard.stock + returned.c.quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _spread(total: int, shards: int) -> list:
+    return [total // shards + (shard < total % shards) for shard in range(shards)]
+
+
+def shard_stock(db: Session, product_id: int, shards: int, total: int = None) -> models.Product:
+    """
+    Spread a product's stock evenly over `shards` sub-counter rows, or with
+    0 keep it all on the product row again. `total` replaces the stock on
+    the way. Runs in the caller's transaction.
+    """
+    product = db.get(models.Product, product_id, with_for_update=True, populate_existing=True)
+    held = db.scalars(
+        select(models.ProductStockShard.stock)
+        .where(models.ProductStockShard.product_id == product_id)
+        .order_by(models.ProductStockShard.shard)
+        .with_for_update()
+    ).all()
+    if total is None:
+        total = product.stock + sum(held)
+    db.execute(delete(models.ProductStockShard).where(models.ProductStockShard.product_id == product_id))
+    if shards:
+        db.execute(insert(models.ProductStockShard), [
+            {"product_id": product_id, "shard": shard, "stock": stock}
+            for shard, stock in enumerate(_spread(total, shards))
+        ])
+    product.stock = 0 if shards else total
+    product.stock_shards = shards
+    db.flush()
+    return product
+
+
+def rebalance_stock_shards(db: Session) -> int:
+    """
+    Even out the shards of every product whose shards have drifted apart,
+    in one statement. Returns the number of shard rows rewritten.
+    """
+    Shard = models.ProductStockShard
+    uneven = select(Shard.product_id).group_by(Shard.product_id).having(
+        func.max(Shard.stock) - func.min(Shard.stock) > 1)
+    # Lock first so the totals include checkouts that committed while we waited
+    locked = select(Shard.product_id, Shard.stock).where(Shard.product_id.in_(uneven)).order_by(
+        Shard.product_id, Shard.shard).with_for_update(key_share=True).cte("locked")
+    totals = select(
+        locked.c.product_id, func.sum(locked.c.stock).label("total"), func.count().label("shards")
+    ).group_by(locked.c.product_id).cte("totals")
+    result = db.execute(
+        update(Shard)
+        .where(Shard.product_id == totals.c.product_id)
+        .values(stock=totals.c.total // totals.c.shards
+                + case((Shard.shard < totals.c.total % totals.c.shards, 1), else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
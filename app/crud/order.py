@@ -1,7 +1,16 @@
-from sqlalchemy.orm import Session
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import Numeric, and_, case, cast, delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 # from sqlalchemy.exc import IntegrityError
 
 from . import models, schemas
+from .idempotency import store_idempotent_response
+from .inventory import decrement_stock, lock_products, restock_order
+from .reservation import release_cart_reservations, reservations_enabled
 
 def get_shipping_address(db: Session, address_id: int, user_id: int):
     return db.query(models.ShippingAddress).filter(
@@ -20,64 +29,83 @@ def calculate_discounted_price(product_price: float, discount: float) -> float:
         return round(product_price - (product_price * (discount / 100)), 2)
     return product_price
 
-def create_order(db: Session, user_id: int, shipping_address_id: int, cart_items: list):
+def discounted_price_expression(product_price, discount):
+    """SQL counterpart of calculate_discounted_price, for pricing rows inside a query."""
+    return case(
+        (and_(discount.is_not(None), discount > 0),
+         func.round(cast(product_price - product_price * (discount / 100), Numeric), 2)),
+        else_=cast(product_price, Numeric),
+    )
+
+def create_order(db: Session, user_id: int, shipping_address_id: int, cart_items: list,
+                 idempotency_key: str = None):
+    """
+    Turn the cart lines into an order in a single transaction. Everything
+    that doesn't need a product lock runs first; the guarded stock
+    decrement comes last, so the product rows, hot ones included, are only
+    locked for that statement and the commit. With an idempotency key
+    (claimed by the caller in this transaction) the response is stored in
+    the same commit as the order.
+    """
     # Verify shipping address
     shipping_address = get_shipping_address(db, address_id=shipping_address_id, user_id=user_id)
     if not shipping_address:
         raise ValueError("Invalid shipping address")
-    
-    total_price = 0.0
-    order_items = []
-    
+
+    quantities = {}
+    for item in cart_items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
     try:
-        # Begin atomic transaction
-        # with db.begin():
-        # Step 1: Pre-validate stock for all products
-        for item in cart_items:
-            product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-            if not product:
-                raise ValueError(f"Product with ID {item.product_id} does not exist.")
-            if product.stock < item.quantity:
-                raise ValueError(f"Insufficient stock for product {item.product_id}. Available: {product.stock}, Requested: {item.quantity}")
-
-        # Step 2: Deduct stock and prepare order items
-        for item in cart_items:
-            product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-                
-            # Deduct stock
-            product.stock -= item.quantity
-            db.add(product)  # Save stock update to the database
-                
-            # Calculate discounted price
-            discounted_price = calculate_discounted_price(product_price=product.price, discount=product.discount_price)
-            total_price += discounted_price * item.quantity
-
-            # Create OrderItem object
-            order_item = models.OrderItem(
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price=discounted_price,
+        # Step 1: Price the lines, without locking anything
+        prices = {
+            product_id: calculate_discounted_price(product_price=price, discount=discount)
+            for product_id, price, discount in db.execute(
+                select(models.Product.id, models.Product.price, models.Product.discount_price)
+                .where(models.Product.id.in_(quantities))
             )
-            order_items.append(order_item)
+        }
+        missing = sorted(set(quantities) - set(prices))
+        if missing:
+            raise ValueError(f"Product with ID {missing[0]} does not exist.")
 
-        # Step 3: Create the order
+        # Step 2: Create the order and its items
         order = models.Order(
             user_id=user_id,
             shipping_address_id=shipping_address_id,
-            total_price=total_price,
+            total_price=sum(prices[product_id] * quantity for product_id, quantity in quantities.items()),
         )
         db.add(order)
+        db.flush()
+        items = db.scalars(
+            insert(models.OrderItem).returning(models.OrderItem),
+            [
+                {"order_id": order.id, "product_id": product_id, "quantity": quantity, "price": prices[product_id]}
+                for product_id, quantity in quantities.items()
+            ],
+        ).all()
+        # The order is new, so these are all of its items; no need to load them
+        set_committed_value(order, "items", items)
+
+        # Step 3: Empty the cart of what was ordered
+        line_ids = [item.id for item in cart_items if getattr(item, "id", None) is not None]
+        if line_ids:
+            db.execute(delete(models.CartItem).where(models.CartItem.id.in_(line_ids)))
+
+        # Step 4: Take the stock. The cart's reservations become the order;
+        # what other carts still hold is not for sale
+        if reservations_enabled():
+            # The release only touches what the cart still holds, so lock
+            # everything up front in one id-ordered pass
+            held = select(models.StockReservation.product_id).join(models.Cart).where(models.Cart.user_id == user_id)
+            lock_products(db, models.Product.id.in_(quantities) | models.Product.id.in_(held))
+            release_cart_reservations(db, user_id)
+        decrement_stock(db, quantities)
+
+        if idempotency_key is not None:
+            store_idempotent_response(db, user_id, idempotency_key,
+                                      schemas.Order.model_validate(order).model_dump(mode="json"))
         db.commit()
-        db.refresh(order)
-
-        # Step 4: Add the order items to the database
-        for order_item in order_items:
-            order_item.order_id = order.id
-            db.add(order_item)
-
-        db.commit()
-        db.refresh(order)
-
         return order
 
     except ValueError as e:
@@ -98,13 +126,46 @@ def update_order_status(db: Session, order_id: int, new_status: str):
     db.refresh(order)
     return order
 
-def get_seller_orders(db: Session, seller_id: int):
-    return db.query(models.Order).join(models.OrderItem).join(models.Product).filter(
-        models.Product.owner_id == seller_id
-    ).all()
+def encode_order_cursor(order: models.Order) -> str:
+    """Opaque cursor for the page after `order` in an order listing."""
+    return base64.urlsafe_b64encode(f"{order.created_at.isoformat()}|{order.id}".encode()).decode()
 
-def get_all_orders(db: Session):
-    return db.query(models.Order).all()
+def decode_order_cursor(cursor: str):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _order_page(query, status=None, created_from: datetime = None, created_to: datetime = None,
+                after: tuple = None, limit: int = None):
+    """
+    Newest first, paged by (created_at, id): `after` is the last order of the
+    previous page, so each page is an index range scan however deep it is.
+    Items come in one more query for the whole page.
+    """
+    if status is not None:
+        query = query.filter(models.Order.status == models.OrderStatus(status))
+    if created_from is not None:
+        query = query.filter(models.Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(models.Order.created_at < created_to)
+    if after is not None:
+        query = query.filter(tuple_(models.Order.created_at, models.Order.id) < tuple_(*after))
+    query = query.options(selectinload(models.Order.items)).order_by(
+        models.Order.created_at.desc(), models.Order.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def get_seller_orders(db: Session, seller_id: int, **page):
+    # Orders with at least one of the seller's products, each listed once
+    seller_order_ids = select(models.OrderItem.order_id).join(models.Product).where(
+        models.Product.owner_id == seller_id)
+    return _order_page(db.query(models.Order).filter(models.Order.id.in_(seller_order_ids)), **page)
+
+def get_all_orders(db: Session, **page):
+    return _order_page(db.query(models.Order), **page)
 
 def is_seller_related_to_order(db: Session, user_id: int, order_id: int):
     return db.query(models.Order).join(models.OrderItem).join(models.Product).filter(
@@ -112,8 +173,8 @@ def is_seller_related_to_order(db: Session, user_id: int, order_id: int):
         models.Order.id == order_id
     ).count() > 0
 
-def get_user_orders(db: Session, user_id: int):
-    return db.query(models.Order).filter(models.Order.user_id == user_id).all()
+def get_user_orders(db: Session, user_id: int, **page):
+    return _order_page(db.query(models.Order).filter(models.Order.user_id == user_id), **page)
 
 def clear_cart(db: Session, user_id: int):
     cart = db.query(models.Cart).filter(models.Cart.user_id == user_id).first()
@@ -122,21 +183,18 @@ def clear_cart(db: Session, user_id: int):
         db.commit()
 
 def cancel_order(db: Session, order_id: int):
-    order = get_order(db=db, order_id=order_id)
-    if not order:
-        raise ValueError("Order not found")
-
-    # Update the order status
-    order.status = models.OrderStatus.CANCELLED
-    db.commit()
-    db.refresh(order)
-
-    # Optional: Restock products
-    for item in order.items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if product:
-            product.stock += item.quantity
-            db.add(product)
+    # Only one of two concurrent cancellations gets to restock
+    cancelled = db.execute(
+        update(models.Order)
+        .where(models.Order.id == order_id,
+               models.Order.status.in_([models.OrderStatus.PENDING, models.OrderStatus.PROCESSING]))
+        .values(status=models.OrderStatus.CANCELLED)
+        .returning(models.Order.id)
+    ).first()
+    if cancelled is None:
+        db.rollback()
+        raise ValueError("Order not found or can no longer be cancelled")
 
+    restock_order(db, order_id)
     db.commit()
-    return order
+    return db.get(models.Order, order_id)
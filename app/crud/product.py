@@ -1,11 +1,9 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
-from passlib.context import CryptContext
 
 from .. import models, schemas
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .inventory import shard_stock
 
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -14,7 +12,7 @@ def get_products(db: Session, skip: int = 0, limit: int = 100, include_inactive:
     query = db.query(models.Product)
     if not include_inactive:
         query = query.filter(models.Product.is_active == True)
-    return query.offset(skip).limit(limit).all()
+    return query.order_by(models.Product.id).offset(skip).limit(limit).all()
 
 # data = crud.create_product(db=db, product=product, owner_id=current_user.id)
 def create_product(db: Session, product: schemas.ProductCreate, owner_id: int):
@@ -26,6 +24,9 @@ def create_product(db: Session, product: schemas.ProductCreate, owner_id: int):
 
 def update_product(db: Session, db_product: models.Product, product_update: schemas.ProductUpdate) -> models.Product:
     update_data = product_update.dict(exclude_unset=True)
+    if db_product.stock_shards and update_data.get("stock") is not None:
+        # Sharded stock is spread over the shards rather than set on the row
+        shard_stock(db, db_product.id, db_product.stock_shards, total=update_data.pop("stock"))
     for key, value in update_data.items():
         setattr(db_product, key, value)
     
@@ -38,6 +39,12 @@ def update_product(db: Session, db_product: models.Product, product_update: sche
     
     return db_product
 
+def set_stock_shards(db: Session, db_product: models.Product, shards: int) -> models.Product:
+    shard_stock(db, db_product.id, shards)
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
 def delete_product(db: Session, db_product: models.Product):
     try:
         db.delete(db_product)
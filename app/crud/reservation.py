@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, column, delete, func, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from .inventory import locked_products
+
+
+def reservations_enabled() -> bool:
+    return settings.stock_reservation_minutes > 0
+
+
+def reserve_stock(db: Session, cart_id: int, quantities: dict):
+    """
+    Make the cart's reservations match `quantities` ({product_id: quantity},
+    0 releases) and restart their clock. Runs inside the caller's
+    transaction; raises a 400 if other carts hold too much of a product.
+    """
+    if not quantities:
+        return
+    held = dict(db.execute(
+        select(models.StockReservation.product_id, models.StockReservation.quantity)
+        .where(models.StockReservation.cart_id == cart_id, models.StockReservation.product_id.in_(quantities))
+        .with_for_update()
+    ).all())
+
+    deltas = {product_id: quantity - held.get(product_id, 0) for product_id, quantity in quantities.items()}
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if deltas:
+        delta = values(column("product_id", Integer), column("delta", Integer), name="delta").data(list(deltas.items()))
+        locked = locked_products(models.Product.id.in_(deltas))
+        # Releases always apply; a new hold only fits in what nobody else holds
+        adjusted = db.scalars(
+            update(models.Product)
+            .where(models.Product.id == delta.c.product_id,
+                   models.Product.id.in_(select(locked.c.id)),
+                   or_(delta.c.delta <= 0, models.Product.total_stock - models.Product.reserved_stock >= delta.c.delta))
+            .values(reserved_stock=models.Product.reserved_stock + delta.c.delta)
+            .returning(models.Product.id)
+        ).all()
+        short = sorted(set(deltas) - set(adjusted))
+        if short:
+            raise HTTPException(status_code=400, detail=f"Not enough stock available for products: {short}")
+
+    released = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+    if released:
+        db.execute(delete(models.StockReservation).where(
+            models.StockReservation.cart_id == cart_id, models.StockReservation.product_id.in_(released)))
+    expires_at = datetime.utcnow() + timedelta(minutes=settings.stock_reservation_minutes)
+    holds = [
+        {"cart_id": cart_id, "product_id": product_id, "quantity": quantity, "expires_at": expires_at}
+        for product_id, quantity in quantities.items() if quantity > 0
+    ]
+    if holds:
+        hold_insert = insert(models.StockReservation).values(holds)
+        db.execute(hold_insert.on_conflict_do_update(
+            constraint="uq_stock_reservations_cart_id_product_id",
+            set_={"quantity": hold_insert.excluded.quantity, "expires_at": hold_insert.excluded.expires_at},
+        ))
+
+
+def _release_where(db: Session, *criteria) -> int:
+    # Delete the matching reservations and hand their units back, one statement
+    released = delete(models.StockReservation).where(*criteria).returning(
+        models.StockReservation.product_id, models.StockReservation.quantity).cte("released")
+    totals = select(released.c.product_id, func.sum(released.c.quantity).label("quantity")).group_by(
+        released.c.product_id).subquery("totals")
+    locked = locked_products(models.Product.id.in_(select(models.StockReservation.product_id).where(*criteria)))
+    result = db.execute(
+        update(models.Product)
+        .where(models.Product.id == totals.c.product_id, models.Product.id.in_(select(locked.c.id)))
+        .values(reserved_stock=models.Product.reserved_stock - totals.c.quantity)
+        .add_cte(released)
+    )
+    return result.rowcount
+
+
+def release_cart_reservations(db: Session, user_id: int) -> int:
+    """Drop every reservation held by the user's cart, e.g. when it's converted into an order."""
+    cart_id = select(models.Cart.id).where(models.Cart.user_id == user_id).scalar_subquery()
+    return _release_where(db, models.StockReservation.cart_id == cart_id)
+
+
+def sweep_expired_reservations(db: Session) -> int:
+    released = _release_where(db, models.StockReservation.expires_at <= datetime.utcnow())
+    db.commit()
+    return released
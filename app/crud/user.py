@@ -1,5 +1,4 @@
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 
 from .. import models, schemas, utils
 
@@ -12,8 +11,8 @@ def get_user(db: Session, user_id: int):
 def get_user_by_emailphone(db: Session, email: str, phone_number: str):
     return db.query(models.User).filter(models.User.email == email or models.User.phone_number == phone_number).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    user.password = utils.hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
+    user.password = hashed_password or utils.hash(user.password)
         
     db_user = models.User(**user.dict())
     # print(models.UserRole.CUSTOMER, models.UserRole.ADMIN, models.UserRole.SELLER)
@@ -21,4 +20,8 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+def increment_token_epoch(db: Session, user_id: int):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.token_epoch: models.User.token_epoch + 1}, synchronize_session=False)
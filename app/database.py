@@ -1,8 +1,16 @@
-from sqlalchemy import create_engine
+import itertools
+
+from fastapi import Request, Response
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import time
 from .config import settings
+from .instrumentation import PoolMetrics
+from . import primary_pin
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
@@ -10,18 +18,109 @@ from psycopg2.extras import RealDictCursor
 # SQLALCHEMY_DATABASE_URL = "postgresql://postgres:Daku408@@localhost/ecommerce"
 SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+pool_options = dict(
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=settings.database_pool_pre_ping,
+)
+
+
+def instrumented_engine(name, url, create=create_engine, poolclass=QueuePool):
+    metrics = PoolMetrics(name, max_overflow=pool_options["max_overflow"])
+    new_engine = create(url, poolclass=metrics.pool_class(poolclass), **pool_options)
+    metrics.attach(getattr(new_engine, "sync_engine", new_engine))
+    return new_engine
+
+
+engine = instrumented_engine("primary", SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+replica_engines = [
+    instrumented_engine(f"replica-{i}", url.strip())
+    for i, url in enumerate(settings.database_replica_urls.split(",")) if url.strip()
+]
+replica_sessions = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in replica_engines]
+_next_replica = itertools.cycle(range(len(replica_sessions))) if replica_sessions else None
+
+ASYNC_SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1)
+
+# Only built when the async routers are enabled, so asyncpg stays optional otherwise
+async_engine = None
+if settings.database_async:
+    async_engine = instrumented_engine(
+        "async", ASYNC_SQLALCHEMY_DATABASE_URL, create=create_async_engine, poolclass=AsyncAdaptedQueuePool)
+
+# Objects must stay readable after commit without an implicit (blocking) refresh
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-def get_db():
+
+def _wrote(session):
+    # The first write of a get_db session pins its user to the primary
+    if session.info.get("wrote"):
+        return
+    session.info["wrote"] = True
+    request, response = session.info.get("pin_to", (None, None))
+    if response is not None and settings.read_your_writes_seconds > 0:
+        user_id = request_user_id(request)
+        if user_id is not None:
+            primary_pin.set_cookie(response, user_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    _wrote(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement(orm_execute_state):
+    if not orm_execute_state.is_select:
+        _wrote(orm_execute_state.session)
+
+
+def request_user_id(request: Request):
+    # Only used to choose a database, so the signature isn't checked here;
+    # the route's own dependencies still authenticate the request.
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("user_id")
+    except JWTError:
+        return None
+
+
+def get_db(request: Request, response: Response = None):
     db = SessionLocal()
+    # Writes set the read-your-writes cookie on the response (see primary_pin)
+    db.info["pin_to"] = (request, response)
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request, response: Response = None):
+    """Session for read-only routes: a replica, round-robin, unless none are
+    configured or the caller's primary_pin cookie says they wrote within the
+    read-your-writes window."""
+    if not replica_sessions or primary_pin.pinned(request.cookies.get(primary_pin.COOKIE_NAME),
+                                                  request_user_id(request)):
+        yield from get_db(request, response)
+        return
+    db = replica_sessions[next(_next_replica)]()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
         
 # while True:
 
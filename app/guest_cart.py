@@ -0,0 +1,62 @@
+"""
+Guest carts, kept entirely in a signed cookie.
+
+The cookie holds `<payload>.<signature>`: the payload is the cart's lines
+as "product_id:quantity" pairs joined with commas, base64url encoded, and
+the signature an HMAC-SHA256 of it keyed with the app's secret. Nothing is
+written to the database until the guest logs in and the cart is merged
+into theirs. A cookie that fails to verify reads as an empty cart.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+
+from .config import settings
+
+COOKIE_NAME = "guest_cart"
+# Keeps the cookie well under the 4 KB browsers allow
+MAX_LINES = 50
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(settings.secret_key.encode(), b"guest-cart." + payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def encode(lines: dict) -> str:
+    payload = _b64encode(",".join(f"{product_id}:{quantity}" for product_id, quantity in sorted(lines.items())).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode(token) -> dict:
+    if not token:
+        return {}
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return {}
+    try:
+        pairs = _b64decode(payload).decode()
+        lines = {}
+        for pair in filter(None, pairs.split(",")):
+            product_id, quantity = pair.split(":")
+            lines[int(product_id)] = int(quantity)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return {}
+    return lines
+
+
+def set_cookie(response, lines: dict):
+    if lines:
+        response.set_cookie(COOKIE_NAME, encode(lines), max_age=int(settings.guest_cart_max_age_seconds),
+                            httponly=True, samesite="lax")
+    else:
+        response.delete_cookie(COOKIE_NAME)
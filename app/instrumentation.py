@@ -0,0 +1,346 @@
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+POOL_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 30000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets + ("+Inf",), self._counts):
+                cumulative += count
+                buckets.append({"le": bound, "count": cumulative})
+            return {"count": self.count, "sum": round(self.total, 3), "max": round(self.max, 3), "buckets": buckets}
+
+
+# ASGI scopes of the requests currently being handled, keyed by the asyncio
+# task running them, so a stalled loop can be traced back to a route.
+in_flight = {}
+
+# Scope of the request being handled; follows the request into the threadpool
+current_scope: ContextVar = ContextVar("current_scope", default=None)
+
+
+class InFlightMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        task = asyncio.current_task()
+        in_flight[task] = scope
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+            in_flight.pop(task, None)
+
+
+def describe_scope(scope) -> str:
+    # FastAPI stores the matched route in the scope once routing has happened
+    route = scope.get("route")
+    return f'{scope.get("method")} {route.path if route is not None else scope.get("path")}'
+
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag with a periodic probe and records it in a
+    histogram. A watchdog thread notices when the probe stops ticking and
+    logs the route and app code that are holding the loop while the stall
+    is still happening.
+    """
+
+    def __init__(self, interval_ms: float, threshold_ms: float):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.histogram = Histogram(LAG_BUCKETS_MS)
+        self.stalls = 0
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()
+        self._probe_task = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped = threading.Event()
+        self._probe_task = self._loop.create_task(self._probe())
+        threading.Thread(target=self._watch, args=(self._stopped,), name="loop-lag-watchdog", daemon=True).start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    async def _probe(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            lag = max(self._heartbeat - started - self.interval, 0)
+            self.histogram.observe(lag * 1000)
+
+    def _watch(self, stopped: threading.Event):
+        reported = None
+        while not stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+            logger.warning(
+                "Event loop blocked for over %.0f ms by %s at %s",
+                stalled * 1000, self._blocking_route(), self._blocking_frame(),
+            )
+
+    def _blocking_route(self) -> str:
+        task = asyncio.current_task(self._loop)
+        scope = in_flight.get(task)
+        return describe_scope(scope) if scope is not None else "a non-request task"
+
+    def _blocking_frame(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        # Report the innermost frame that belongs to the application
+        while frame is not None:
+            if frame.f_code.co_filename.startswith(APP_DIR) and frame.f_code.co_filename != __file__:
+                return f"{os.path.relpath(frame.f_code.co_filename, APP_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            frame = frame.f_back
+        return "code outside the app package"
+
+    def stats(self):
+        return {"stalls": self.stalls, "threshold_ms": self.threshold * 1000, "lag_ms": self.histogram.snapshot()}
+
+
+loop_lag_monitor = LoopLagMonitor(
+    interval_ms=settings.loop_lag_probe_interval_ms,
+    threshold_ms=settings.loop_lag_threshold_ms,
+)
+
+
+# PoolMetrics of every instrumented engine, by name
+pool_metrics = {}
+
+
+class PoolMetrics:
+    """
+    Connection pool statistics for one engine. Checkout latency is timed
+    around the public `connect()` of the pool class returned by
+    `pool_class`; connection counts come from the pool events registered by
+    `attach`. A checkout that finds every connection (the pool size plus
+    `max_overflow`) in use counts as a wait.
+    """
+
+    def __init__(self, name: str, max_overflow: int = settings.database_max_overflow):
+        self.name = name
+        self.max_overflow = max_overflow
+        self.checkout_ms = Histogram(POOL_BUCKETS_MS)
+        self.wait_ms = Histogram(POOL_BUCKETS_MS)
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self._engine = None
+        self._lock = threading.Lock()
+        pool_metrics[name] = self
+
+    def pool_class(self, base):
+        metrics = self
+
+        class InstrumentedPool(base):
+            def connect(self):
+                exhausted = metrics.max_overflow > -1 and self.checkedout() >= self.size() + metrics.max_overflow
+                started = time.perf_counter()
+                try:
+                    return super().connect()
+                except exc.TimeoutError:
+                    with metrics._lock:
+                        metrics.timeouts += 1
+                    raise
+                finally:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    metrics.checkout_ms.observe(elapsed)
+                    if exhausted:
+                        metrics.wait_ms.observe(elapsed)
+
+        InstrumentedPool.__name__ = InstrumentedPool.__qualname__ = f"Instrumented{base.__name__}"
+        return InstrumentedPool
+
+    def attach(self, engine):
+        self._engine = engine
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out -= 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        pool = self._engine.pool if self._engine is not None else None
+        with self._lock:
+            return {
+                "pool_size": pool.size() if pool is not None else None,
+                "max_overflow": self.max_overflow,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checkout_latency_ms": self.checkout_ms.snapshot(),
+                "wait_ms": self.wait_ms.snapshot(),
+            }
+
+
+class QueryStats:
+    """Statements executed while handling one request (or one `track_queries` block)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        # Parameters are bound separately, so the SQL text is the statement's shape
+        self.shapes[" ".join(statement.split())] += 1
+
+    def repeated(self, threshold: int):
+        """Shapes run at least `threshold` times: likely a query inside a loop."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+current_query_stats: ContextVar = ContextVar("current_query_stats", default=None)
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+
+
+# Registered on the Engine class, so every engine (primary, replicas, async) is covered
+event.listen(Engine, "before_cursor_execute", _start_query_timer)
+event.listen(Engine, "after_cursor_execute", _stop_query_timer)
+
+
+@contextmanager
+def track_queries(engine):
+    """Collect QueryStats for everything `engine` executes inside the block, from any thread."""
+    stats = QueryStats()
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("tracked_query_started", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        stats.record(statement, (time.perf_counter() - conn.info["tracked_query_started"].pop()) * 1000)
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    try:
+        yield stats
+    finally:
+        event.remove(engine, "before_cursor_execute", before)
+        event.remove(engine, "after_cursor_execute", after)
+
+
+class QueryStatsMiddleware:
+    """
+    Counts the statements and DB time of each request and reports them in
+    X-DB-Query-Count / X-DB-Time-Ms headers. Statement shapes repeated at
+    least `n_plus_one_threshold` times are counted in X-DB-N-Plus-One and
+    logged with the route, as N+1 candidates. Meant for debug mode.
+    """
+
+    def __init__(self, app, n_plus_one_threshold: int = 5):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                repeated = stats.repeated(self.n_plus_one_threshold)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-query-count", str(stats.count).encode()),
+                    (b"x-db-time-ms", f"{stats.total_ms:.1f}".encode()),
+                    (b"x-db-n-plus-one", str(len(repeated)).encode()),
+                ]
+                for shape, count in repeated:
+                    logger.warning("Possible N+1 in %s: %d x %s", describe_scope(scope), count, _truncate(shape))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_query_stats.reset(token)
+
+
+def _truncate(statement: str, limit: int = 200) -> str:
+    return statement if len(statement) <= limit else statement[:limit] + "..."
@@ -1,12 +1,49 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from.routers import users, products, auth, carts, orders, addresses
-from . import models
-from .database import engine
+from fastapi.concurrency import run_in_threadpool
+from.routers import users, products, auth, carts, orders, addresses, metrics
+from .routers.aio import (products as aio_products, orders as aio_orders, carts as aio_carts,
+                          users as aio_users, addresses as aio_addresses)
+from . import utils
+from .instrumentation import InFlightMiddleware, QueryStatsMiddleware, loop_lag_monitor
+from .config import settings
+from .database import async_engine, SessionLocal
+from .migrations import prepare_schema
+from .revocation import revocation_filter
+from .slow_queries import slow_query_log
+from .cart_store import cart_store
+from .tasks import run_with_session, start_background_jobs, stop_background_jobs
 from fastapi.middleware.cors import CORSMiddleware
 
-models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+def warm_caches():
+    db = SessionLocal()
+    try:
+        if settings.token_revocation_mode == "blacklist" and settings.token_revocation_filter:
+            revocation_filter.load(db)
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(prepare_schema)
+    await run_in_threadpool(warm_caches)
+    background_jobs = start_background_jobs()
+    if settings.loop_lag_monitor_enabled:
+        loop_lag_monitor.start()
+    yield
+    await loop_lag_monitor.stop()
+    await stop_background_jobs(background_jobs)
+    # Carts edited since the last flush would otherwise only live in Redis
+    await run_in_threadpool(run_with_session, cart_store.flush_dirty)
+    utils.hashing_pool.shutdown()
+    slow_query_log.close()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ['*']
 
@@ -17,6 +54,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(InFlightMiddleware)
+if settings.debug:
+    app.add_middleware(QueryStatsMiddleware, n_plus_one_threshold=settings.n_plus_one_threshold)
+
+# The async routers serve the same paths over an AsyncSession
+if settings.database_async:
+    products, orders, users, addresses = aio_products, aio_orders, aio_users, aio_addresses
+    # The Redis cart store's client is blocking, so those carts stay in the threadpool
+    if settings.cart_backend == "sql":
+        carts = aio_carts
 
 app.include_router(products.router)
 app.include_router(users.router)
@@ -24,6 +71,7 @@ app.include_router(auth.router)
 app.include_router(carts.router)
 app.include_router(orders.router)
 app.include_router(addresses.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,94 @@
+"""
+Schema handling at startup, selected with SCHEMA_STARTUP_MODE:
+
+- "none": assume the schema is managed out of band.
+- "check": compare the database's Alembic revision with the newest
+  migration and log a warning when they differ (one cheap query).
+- "migrate": run `alembic upgrade head`, serialized across workers with
+  a Postgres advisory lock so only one of them applies migrations.
+- "create": `create_all` on the models, for throwaway development databases.
+"""
+import logging
+import os
+
+from sqlalchemy import inspect, text
+
+from .config import settings
+from .database import engine
+from .models import Base
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+# Arbitrary key for pg_advisory_lock, shared by every worker
+MIGRATION_LOCK_ID = 7213640110
+
+
+def alembic_config():
+    from alembic.config import Config
+    config = Config(ALEMBIC_INI)
+    config.attributes["configure_logger"] = False
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    return config
+
+
+def head_revisions():
+    from alembic.script import ScriptDirectory
+    return set(ScriptDirectory.from_config(alembic_config()).get_heads())
+
+
+def current_revisions(connection):
+    from alembic.runtime.migration import MigrationContext
+    return set(MigrationContext.configure(connection).get_current_heads())
+
+
+def check_schema(bind=engine):
+    with bind.connect() as connection:
+        current = current_revisions(connection)
+    expected = head_revisions()
+    if current != expected:
+        logger.warning(
+            "Database schema is at revision %s but the code expects %s; run `alembic upgrade head`",
+            ", ".join(sorted(current)) or "none", ", ".join(sorted(expected)),
+        )
+        return False
+    return True
+
+
+def upgrade_schema(bind=engine):
+    from alembic import command
+    with bind.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            config = alembic_config()
+            # env.py runs the migrations on this connection
+            config.attributes["connection"] = connection
+            empty = not current_revisions(connection) and not inspect(connection).get_table_names()
+            # The lock is session-level, so it outlives this transaction. Alembic
+            # has to begin its own for autocommit_block (CREATE INDEX CONCURRENTLY).
+            connection.commit()
+            if empty:
+                # The early migrations alter tables that predate Alembic, so an
+                # empty database is built from the models and stamped instead
+                Base.metadata.create_all(bind=connection)
+                command.stamp(config, "head")
+            else:
+                command.upgrade(config, "head")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+
+
+def prepare_schema(mode=None):
+    mode = mode or settings.schema_startup_mode
+    if mode == "check":
+        check_schema()
+    elif mode == "migrate":
+        upgrade_schema()
+    elif mode == "create":
+        Base.metadata.create_all(bind=engine)
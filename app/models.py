@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime, Text, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime, Text, Enum, case, func, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql.expression import text   
-from sqlalchemy.schema import CheckConstraint
+from sqlalchemy.schema import CheckConstraint, Index, UniqueConstraint
 from .database import Base
 from datetime import datetime
 
@@ -32,6 +33,8 @@ class User(Base):
     password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     role = Column(Enum(UserRole), nullable=False, default=UserRole.CUSTOMER)
+    # Bumped on logout in "epoch" revocation mode; tokens stamped with an older value are rejected
+    token_epoch = Column(Integer, nullable=False, default=0, server_default=text("0"))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     cart = relationship("Cart", back_populates="user")
@@ -55,13 +58,19 @@ class Product(Base):
     sale_start_date = Column(DateTime, nullable=True)
     sale_end_date = Column(DateTime, nullable=True)
     stock = Column(Integer, nullable=False, default=0)
+    # Units held by live cart reservations (see StockReservation); kept as a
+    # counter so available stock doesn't need a scan of the reservations
+    reserved_stock = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    # Number of ProductStockShard rows the stock is spread over; 0 keeps it
+    # all in `stock`. A sharded product's `stock` stays 0, see total_stock.
+    stock_shards = Column(Integer, nullable=False, default=0, server_default=text("0"))
     is_active = Column(Boolean, default=True)
     category = Column(String, nullable=False)
     brand = Column(String, nullable=False) 
     image_url = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
 
     owner = relationship("User", back_populates="products")
     # reviews = relationship("Review", back_populates="product")
@@ -69,7 +78,14 @@ class Product(Base):
     __table_args__ = (
         CheckConstraint('price > 0', name='check_price_positive'),
         CheckConstraint('stock >= 0', name='check_stock_non_negative'),
+        CheckConstraint('reserved_stock >= 0', name='check_reserved_stock_non_negative'),
+        # Listing pages walk active products in id order
+        Index('ix_products_is_active_id', 'is_active', 'id'),
     )
+
+    @property
+    def available_stock(self):
+        return self.total_stock - (self.reserved_stock or 0)
    
 class Cart(Base):
     __tablename__ = "carts"
@@ -89,15 +105,53 @@ class CartItem(Base):
     quantity = Column(Integer, default=1)
     __table_args__ = (
         CheckConstraint('quantity > 0', name='check_quantity_positive'),
+        # One line per product; add-to-cart upserts against it
+        UniqueConstraint('cart_id', 'product_id', name='uq_cart_items_cart_id_product_id'),
     )
 
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product")
 
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cart_id = Column(Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        CheckConstraint('quantity > 0', name='check_reservation_quantity_positive'),
+        UniqueConstraint('cart_id', 'product_id', name='uq_stock_reservations_cart_id_product_id'),
+    )
+
+class ProductStockShard(Base):
+    """One of a hot product's sub-counters; checkouts decrement different shards in parallel."""
+    __tablename__ = "product_stock_shards"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        CheckConstraint('stock >= 0', name='check_shard_stock_non_negative'),
+    )
+
+# A product's stock wherever it is kept; the shards are only summed for sharded products
+Product.total_stock = column_property(case(
+    (Product.stock_shards > 0, Product.stock + func.coalesce(
+        select(func.sum(ProductStockShard.stock))
+        .where(ProductStockShard.product_id == Product.id)
+        .correlate_except(ProductStockShard)
+        .scalar_subquery(), 0)),
+    else_=Product.stock,
+))
+
 class ShippingAddress(Base):
     __tablename__ = "shipping_addresses"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     street = Column(String, nullable=False)
     city = Column(String, nullable=False)
     state = Column(String, nullable=False)
@@ -112,7 +166,7 @@ class ShippingAddress(Base):
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     status = Column(Enum(OrderStatus), default=OrderStatus.PENDING, nullable=False)
     shipping_address_id = Column(Integer, ForeignKey("shipping_addresses.id", ondelete="CASCADE"), nullable=False)
     total_price = Column(Float, nullable=False)
@@ -123,12 +177,18 @@ class Order(Base):
     shipping_address = relationship("ShippingAddress")
     items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        # Order listings page newest first by (created_at, id)
+        Index('ix_orders_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_orders_created_at_id', 'created_at', 'id'),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
 
@@ -138,10 +198,24 @@ class OrderItem(Base):
 class TokenBlacklist(Base):
     __tablename__ = "token_blacklist"
 
-    id = Column(Integer, primary_key=True, index=True)
-    token = Column(String, unique=True, index=True)
-    blacklisted_at = Column(DateTime, default=datetime.utcnow)
-    expiry_time = Column(DateTime)
+    # jti claim, or a SHA-256 hex digest for tokens issued without one
+    token_key = Column(String(64), primary_key=True)
+    blacklisted_at = Column(DateTime, default=datetime.utcnow, index=True)
+    expiry_time = Column(DateTime, nullable=False)
+    # expiry_time truncated to the hour, so expired rows are purged a bucket at a time
+    expiry_bucket = Column(Integer, nullable=False, index=True)
+
+class IdempotencyKey(Base):
+    """The stored result of a request sent with an Idempotency-Key header, replayed to retries."""
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # SHA-256 of the request body; a key can't be reused for a different request
+    request_hash = Column(String(64), nullable=False)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 
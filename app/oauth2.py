@@ -1,11 +1,16 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from . import schemas, database, models
+from .cache import TTLCache
+from .revocation import revocation_filter, token_key
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from .config import settings
-from typing import Optional
+from typing import NamedTuple, Optional
+import uuid
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
 
@@ -13,10 +18,21 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+
+class Principal(NamedTuple):
+    """The parts of a user every authenticated request needs."""
+    id: int
+    role: models.UserRole
+    is_active: bool
+    token_epoch: int
+
+
+principal_cache = TTLCache(maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl_seconds)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -26,22 +42,18 @@ def verify_access_token(token: str, credentials_exception):
         user_id: str = payload.get("user_id")
         if user_id is None:
             raise credentials_exception
-        token_data = schemas.TokenData(id=str(user_id))
+        token_data = schemas.TokenData(id=str(user_id), jti=payload.get("jti"), epoch=payload.get("epoch", 0))
     except JWTError:
         raise credentials_exception
     
     return token_data
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    blacklisted_token = db.query(models.TokenBlacklist).filter(models.TokenBlacklist.token == token).first()
-
-    if blacklisted_token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token is blacklisted, please log in again",
-        )
-
+def is_token_blacklisted(db: Session, key: str) -> bool:
+    if settings.token_revocation_filter:
+        return revocation_filter.is_revoked(db, key)
+    return db.get(models.TokenBlacklist, key) is not None
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,19 +61,67 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
     
     token_data = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+
+    if settings.token_revocation_mode == "blacklist" and is_token_blacklisted(db, token_key(token, token_data.jti)):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token is blacklisted, please log in again",
+        )
+
+    user = get_principal(db, int(token_data.id))
     
     if user is None:
         raise credentials_exception    
+
+    if settings.token_revocation_mode == "epoch" and token_data.epoch < user.token_epoch:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked, please log in again",
+        )
     return user
 
-def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    return await db.run_sync(lambda session: get_current_user(token=token, db=session))
+
+def get_principal(db: Session, user_id: int) -> Optional[Principal]:
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = db.query(
+            models.User.id, models.User.role, models.User.is_active, models.User.token_epoch
+        ).filter(models.User.id == user_id).first()
+        if row is None:
+            return None
+        principal = Principal(*row)
+        principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id: int):
+    principal_cache.pop(user_id)
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_changed_principal(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("role", "is_active", "token_epoch")):
+        invalidate_principal(target.id)
+        # Drop it again once committed, in case a concurrent request cached the old row meanwhile
+        state.session.info.setdefault("stale_principals", set()).add(target.id)
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_deleted_principal(mapper, connection, target):
+    invalidate_principal(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_principals(session):
+    for user_id in session.info.pop("stale_principals", ()):
+        invalidate_principal(user_id)
+
+def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 def get_user_with_roles(allowed_roles: list):
-    def get_current_user_with_roles(current_user: models.User = Depends(get_current_active_user)):
+    def get_current_user_with_roles(current_user: Principal = Depends(get_current_active_user)):
         if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
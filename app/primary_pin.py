@@ -0,0 +1,41 @@
+"""
+Read-your-writes pins, kept in a short-lived signed cookie.
+
+A response to a request that wrote through the primary carries a cookie
+holding `<user_id>.<expiry>.<signature>`, the signature an HMAC-SHA256 of
+the rest keyed with the app's secret. Until it expires get_read_db keeps
+that user's reads on the primary, whichever worker serves them, so they
+see their own writes before the replicas catch up. A cookie that fails to
+verify, has expired or names another user doesn't pin anything.
+"""
+import hashlib
+import hmac
+import math
+import time
+
+from .config import settings
+
+COOKIE_NAME = "primary_pin"
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(settings.secret_key.encode(), b"primary-pin." + payload.encode(), hashlib.sha256).hexdigest()
+
+
+def set_cookie(response, user_id: int):
+    payload = f"{user_id}.{time.time() + settings.read_your_writes_seconds:.3f}"
+    response.set_cookie(COOKIE_NAME, f"{payload}.{_sign(payload)}",
+                        max_age=math.ceil(settings.read_your_writes_seconds), httponly=True, samesite="lax")
+
+
+def pinned(token, user_id) -> bool:
+    if not token or user_id is None:
+        return False
+    payload, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return False
+    pinned_user, _, expires = payload.partition(".")
+    try:
+        return int(pinned_user) == user_id and float(expires) > time.time()
+    except ValueError:
+        return False
@@ -0,0 +1,171 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+
+# Rows written by other workers are picked up by comparing against
+# blacklisted_at, so allow a little clock skew between hosts.
+SYNC_SKEW = timedelta(seconds=5)
+
+BUCKET_SECONDS = 3600
+
+
+def token_key(token: str, jti: str = None) -> str:
+    if jti:
+        return jti
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def expiry_bucket(expiry_time: datetime) -> int:
+    return int((expiry_time - datetime(1970, 1, 1)).total_seconds() // BUCKET_SECONDS)
+
+
+def blacklist_token(db: Session, key: str, expiry_time: datetime):
+    # Logging out twice is not an error
+    db.execute(insert(models.TokenBlacklist).values(
+        token_key=key,
+        expiry_time=expiry_time,
+        expiry_bucket=expiry_bucket(expiry_time),
+    ).on_conflict_do_nothing())
+
+
+def purge_expired_tokens(db: Session) -> int:
+    # Every bucket before the current one has fully expired
+    current_bucket = expiry_bucket(datetime.utcnow())
+    deleted = db.query(models.TokenBlacklist).filter(
+        models.TokenBlacklist.expiry_bucket < current_bucket
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 64)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationFilter:
+    """
+    In-process view of the token blacklist.
+
+    A Bloom filter answers "definitely not revoked" without touching the
+    database; only filter hits fall back to the token_blacklist table.
+    Revocations seen since the last full load are also kept in an exact set,
+    so a token logged out recently is rejected without a query.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, refresh_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._recent = set()
+        self._synced_at = None
+        self._checked_at = 0.0
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._recent = set()
+            self._synced_at = None
+
+    def load(self, db: Session):
+        now = datetime.utcnow()
+        keys = [key for (key,) in db.query(models.TokenBlacklist.token_key).filter(
+            models.TokenBlacklist.expiry_time > now
+        )]
+        bloom = BloomFilter(max(self.capacity, len(keys) * 2), self.error_rate)
+        for key in keys:
+            bloom.add(key)
+
+        with self._lock:
+            self._bloom = bloom
+            self._recent = set()
+            self._synced_at = now
+            self._checked_at = time.monotonic()
+
+    def _refresh(self, db: Session):
+        # Pick up logouts handled by other workers since the last sync
+        now = datetime.utcnow()
+        keys = [key for (key,) in db.query(models.TokenBlacklist.token_key).filter(
+            models.TokenBlacklist.blacklisted_at >= self._synced_at - SYNC_SKEW
+        )]
+        for key in keys:
+            self._remember(key)
+        self._synced_at = now
+        self._checked_at = time.monotonic()
+
+    def _remember(self, key: str):
+        if key not in self._recent:
+            self._recent.add(key)
+            self._bloom.add(key)
+
+    def _ensure_fresh(self, db: Session):
+        if self._bloom is None:
+            with self._lock:
+                loaded = self._bloom is not None
+            if not loaded:
+                self.load(db)
+            return
+
+        if time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+
+        # Only one request pays for the refresh; the rest keep using the current view
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            overfull = self._bloom.count > self._bloom.capacity
+            if not overfull:
+                self._refresh(db)
+        finally:
+            self._lock.release()
+        if overfull:
+            self.load(db)
+
+    def revoke(self, key: str):
+        with self._lock:
+            if self._bloom is not None:
+                self._remember(key)
+
+    def is_revoked(self, db: Session, key: str) -> bool:
+        self._ensure_fresh(db)
+        if key in self._recent:
+            return True
+        if key not in self._bloom:
+            return False
+        return db.get(models.TokenBlacklist, key) is not None
+
+
+revocation_filter = RevocationFilter(
+    capacity=settings.revocation_filter_capacity,
+    error_rate=settings.revocation_filter_error_rate,
+    refresh_seconds=settings.revocation_filter_refresh_seconds,
+)
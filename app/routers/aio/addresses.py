@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from ... import schemas, oauth2, database
+from ...crud import aio
+from .. import addresses
+
+# Async counterpart of routers/addresses.py: the same handlers, run on an
+# AsyncSession through crud.aio.run instead of in the threadpool.
+router = APIRouter(
+    prefix="/shipping-addresses",
+    tags=["Shipping Address"]
+)
+
+@router.get("/", response_model=List[schemas.ShippingAddress])
+async def get_shipping_addresses(db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)):
+    return await aio.run(db, addresses.get_shipping_addresses, current_user=current_user,
+                         schema=List[schemas.ShippingAddress])
+
+@router.get("/{address_id}", response_model=schemas.ShippingAddress)
+async def get_shipping_address(
+    address_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+):
+    return await aio.run(db, addresses.get_shipping_address, address_id=address_id, current_user=current_user,
+                         schema=schemas.ShippingAddress)
+
+@router.post("/", status_code= status.HTTP_201_CREATED, response_model=schemas.ShippingAddress)
+async def create_shipping_address(
+    address: schemas.ShippingAddressCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+):
+    return await aio.run(db, addresses.create_shipping_address, address=address, current_user=current_user,
+                         schema=schemas.ShippingAddress)
+
+@router.put("/{address_id}", response_model=schemas.ShippingAddress)
+async def update_shipping_address(
+    address_id: int,
+    address: schemas.ShippingAddressCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+):
+    return await aio.run(db, addresses.update_shipping_address, address_id=address_id, address=address,
+                         current_user=current_user, schema=schemas.ShippingAddress)
+
+@router.delete("/{address_id}", response_model=dict)
+async def delete_shipping_address(
+    address_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+):
+    return await aio.run(db, addresses.delete_shipping_address, address_id=address_id, current_user=current_user)
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Cookie, Depends, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from ... import schemas, oauth2, database, guest_cart
+from ...cart_store import get_cart_store
+from ...crud import aio
+from .. import carts
+
+# Async counterpart of routers/carts.py: the same handlers, run on an
+# AsyncSession through crud.aio.run instead of in the threadpool. Only
+# used with the SQL cart store; the Redis client would block the event loop.
+router = APIRouter(
+    prefix="/carts",
+    tags=['Cart']
+)
+
+
+@router.get("/", response_model=schemas.Cart)
+async def read_cart(db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    return await aio.run(db, carts.read_cart, current_user=current_user, store=store, schema=schemas.Cart)
+
+@router.get("/expanded/", response_model=schemas.ExpandedCart)
+async def read_expanded_cart(db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    return await aio.run(db, carts.read_expanded_cart, current_user=current_user, store=store,
+                         schema=schemas.ExpandedCart)
+
+# The guest cart lives in its cookie; only adding a line reads the database
+@router.get("/guest/", response_model=schemas.GuestCart)
+async def read_guest_cart(guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
+    return carts.read_guest_cart(guest_cart_token=guest_cart_token)
+
+@router.post("/guest/items/", response_model=schemas.GuestCart)
+async def add_to_guest_cart(item: schemas.CartItemCreate, response: Response, db: AsyncSession = Depends(database.get_async_db),
+                            guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
+    return await aio.run(db, carts.add_to_guest_cart, item=item, response=response, guest_cart_token=guest_cart_token,
+                         schema=schemas.GuestCart)
+
+@router.delete("/guest/items/{product_id}", response_model=schemas.GuestCart)
+async def remove_from_guest_cart(product_id: int, response: Response,
+                                 guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
+    return carts.remove_from_guest_cart(product_id=product_id, response=response, guest_cart_token=guest_cart_token)
+
+@router.post("/items/", response_model=schemas.CartItem)
+async def add_to_cart(item: schemas.CartItemCreate, db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    return await aio.run(db, carts.add_to_cart, item=item, current_user=current_user, store=store,
+                         schema=schemas.CartItem)
+
+@router.post("/batch/", response_model=schemas.Cart)
+async def apply_cart_batch(batch: schemas.CartBatch, db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    return await aio.run(db, carts.apply_cart_batch, batch=batch, current_user=current_user, store=store,
+                         schema=schemas.Cart)
+
+@router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_item_from_cart(item_id: int, db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    await aio.run(db, carts.remove_item_from_cart, item_id=item_id, current_user=current_user, store=store)
+
+@router.put("/items/{item_id}", response_model=schemas.CartItem)
+async def update_cart_item(item_id: int, item: schemas.CartItemUpdate, db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    return await aio.run(db, carts.update_cart_item, item_id=item_id, item=item, current_user=current_user,
+                         store=store, schema=schemas.CartItem)
+
+@router.delete("/clear/", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_cart(db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    await aio.run(db, carts.clear_cart, current_user=current_user, store=store)
+
+@router.get("/amount/", status_code=status.HTTP_200_OK, response_model=schemas.CartTotal)
+async def get_cart_total(db: AsyncSession = Depends(database.get_async_db), current_user: oauth2.Principal = Depends(oauth2.get_current_user_async), store=Depends(get_cart_store)):
+    return await aio.run(db, carts.get_cart_total, current_user=current_user, store=store, schema=schemas.CartTotal)
@@ -0,0 +1,71 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from ... import schemas, oauth2, database
+from ...cart_store import get_cart_store
+from ...crud import aio
+from .. import orders
+
+# Async counterpart of routers/orders.py: the same handlers, run on an
+# AsyncSession through crud.aio.run instead of in the threadpool.
+router = APIRouter(
+    prefix="/orders",
+    tags=['Order']
+)
+
+@router.post("/", response_model=schemas.Order)
+async def create_order(
+    order: schemas.OrderCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async),
+    store=Depends(get_cart_store),
+    response: Response = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    return await aio.run(db, orders.create_order, order=order, current_user=current_user, store=store,
+                         response=response, idempotency_key=idempotency_key, schema=schemas.Order)
+
+
+@router.get("/", response_model=List[schemas.Order])
+async def get_orders(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async),
+    response: Response = None,
+    order_status: Optional[schemas.OrderStatus] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200)
+):
+    return await aio.run(db, orders.get_orders, current_user=current_user, response=response,
+                         order_status=order_status, created_from=created_from, created_to=created_to,
+                         cursor=cursor, limit=limit, schema=List[schemas.Order])
+
+@router.get("/{order_id}", response_model=schemas.Order)
+async def get_order_by_id(
+    order_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+):
+    return await aio.run(db, orders.get_order_by_id, order_id=order_id, current_user=current_user, schema=schemas.Order)
+
+
+@router.patch("/{order_id}/status", response_model=schemas.Order)
+async def update_order_status(
+    order_id: int,
+    order_status: schemas.OrderStatusUpdate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+    ):
+    return await aio.run(db, orders.update_order_status, order_id=order_id, order_status=order_status,
+                         current_user=current_user, schema=schemas.Order)
+
+@router.patch("/{order_id}/cancel", response_model=schemas.Order)
+async def cancel_order(
+    order_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+):
+    return await aio.run(db, orders.cancel_order, order_id=order_id, current_user=current_user, schema=schemas.Order)
@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Depends, status, Query, Path
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from ... import schemas, oauth2, database
+from ...crud import aio
+from .. import products
+
+# Async counterpart of routers/products.py: the same handlers, run on an
+# AsyncSession through crud.aio.run instead of in the threadpool.
+router = APIRouter(
+    prefix="/products",
+    tags=['Products']
+)
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Product)
+async def create_product(
+    product: schemas.ProductCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+    ):
+    return await aio.run(db, products.create_product, product=product, current_user=current_user, schema=schemas.Product)
+
+@router.put("/{id}", status_code = status.HTTP_200_OK ,response_model=schemas.Product)
+async def update_product(
+    id: int,
+    product_update: schemas.ProductUpdate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+    ):
+    return await aio.run(db, products.update_product, id=id, product_update=product_update,
+                         current_user=current_user, schema=schemas.Product)
+
+@router.put("/{id}/stock-shards", response_model=schemas.Product)
+async def set_stock_shards(
+    id: int,
+    stock_shards: schemas.StockShards,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+    ):
+    return await aio.run(db, products.set_stock_shards, id=id, stock_shards=stock_shards,
+                         current_user=current_user, schema=schemas.Product)
+
+
+@router.get("/", response_model=List[schemas.Product])
+async def get_all_products(
+    skip: int = 0,
+    limit: int = 100,
+    include_inactive: bool = False,
+    db: AsyncSession = Depends(database.get_async_db)
+    ):
+    return await aio.run(db, products.get_all_products, skip=skip, limit=limit,
+                         include_inactive=include_inactive, schema=List[schemas.Product])
+
+@router.get("/search", response_model=List[schemas.Product])
+async def search_products(
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    is_active: Optional[bool] = None,
+    on_sale: Optional[bool] = Query(None, description="Filter for products currently on sale"),
+    db: AsyncSession = Depends(database.get_async_db)
+    ):
+    return await aio.run(db, products.search_products, category=category, brand=brand, min_price=min_price,
+                         max_price=max_price, is_active=is_active, on_sale=on_sale, schema=List[schemas.Product])
+
+@router.get("/{id}", response_model=schemas.Product)
+async def get_product_by_id(
+    id: int = Path(..., gt=0),
+    db: AsyncSession = Depends(database.get_async_db)
+    ):
+    return await aio.run(db, products.get_product_by_id, id=id, schema=schemas.Product)
+
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_product(
+    id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: oauth2.Principal = Depends(oauth2.get_current_user_async)
+    ):
+    return await aio.run(db, products.delete_product, id=id, current_user=current_user)
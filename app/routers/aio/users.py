@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from ... import schemas, database
+from ...crud import aio
+from .. import users
+
+# Async counterpart of routers/users.py: the same handlers, run on an
+# AsyncSession through crud.aio.run instead of in the threadpool.
+router = APIRouter(
+    prefix="/users",
+    tags=['Users']
+)
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.User)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    users.ensure_not_registered(
+        await aio.get_user_by_emailphone(db=db, email=user.email, phone_number=user.phone_number), user)
+    hashed_password = await users.hash_password(user.password)
+    return await aio.create_user(db=db, user=user, hashed_password=hashed_password)
+
+@router.get('/', response_model=List[schemas.User])
+async def get_users(db: AsyncSession = Depends(database.get_async_db)):
+    return await aio.run(db, users.get_users, schema=List[schemas.User])
+
+@router.get('/{id}', response_model=schemas.User)
+async def get_user(id: int, db: AsyncSession = Depends(database.get_async_db)):
+    return await aio.run(db, users.get_user, id=id, schema=schemas.User)
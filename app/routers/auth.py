@@ -1,50 +1,76 @@
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi import APIRouter, Cookie, Depends, status, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Optional
 
-from .. import database, schemas, models, oauth2, utils
-import jwt
+from .. import database, schemas, models, oauth2, utils, revocation, crud, guest_cart
+from ..cart_store import get_cart_store
+from ..config import settings
+from jose import JWTError, jwt
 
 router = APIRouter(tags=['Authentication'])
 
 
 @router.post('/login/', response_model=schemas.Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+async def login(response: Response, user_credentials: OAuth2PasswordRequestForm = Depends(),
+                db: Session = Depends(database.get_db), store=Depends(get_cart_store),
+                guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
 
-    user = db.query(models.User).filter(
-        models.User.email == user_credentials.username).first()
+    user = await run_in_threadpool(
+        lambda: db.query(models.User).filter(models.User.email == user_credentials.username).first())
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
 
-    if not utils.verify(user_credentials.password, user.password):
+    try:
+        verified = await utils.verify_async(user_credentials.password, user.password)
+    except utils.HashingPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress, please retry shortly",
+            headers={"Retry-After": "1"})
+
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
 
     # create a token
     # return token
-    access_token = oauth2.create_access_token(data={"user_id": user.id})
+    access_token = oauth2.create_access_token(data={"user_id": user.id, "epoch": user.token_epoch})
+
+    # Carry over what the user put in their cart before logging in
+    if guest_cart_token is not None:
+        lines = guest_cart.decode(guest_cart_token)
+        if lines and user.role == models.UserRole.CUSTOMER:
+            await run_in_threadpool(store.merge_guest_cart, db, user.id, lines)
+        response.delete_cookie(guest_cart.COOKIE_NAME)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/logout/")
-async def logout(token: str = Depends(oauth2.oauth2_scheme), db: Session = Depends(database.get_db)):
+def logout(token: str = Depends(oauth2.oauth2_scheme), db: Session = Depends(database.get_db)):
     # Extract expiry from the token if available
     try:
         payload = jwt.decode(token, oauth2.SECRET_KEY, algorithms=[oauth2.ALGORITHM])
         expiry_time = payload.get("exp")
-    except jwt.PyJWTError:
+    except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    # Create a blacklist entry in the database
-    blacklisted_token = models.TokenBlacklist(
-        token=token,
-        expiry_time=datetime.utcfromtimestamp(expiry_time)  # Store token's expiry
-    )
-    db.add(blacklisted_token)
-    db.commit()
+    if settings.token_revocation_mode == "epoch":
+        # Invalidates every token issued to the user so far
+        user_id = payload.get("user_id")
+        crud.increment_token_epoch(db, user_id)
+        db.commit()
+        oauth2.invalidate_principal(user_id)
+    else:
+        # Create a blacklist entry in the database, keyed by the token's jti
+        key = revocation.token_key(token, payload.get("jti"))
+        revocation.blacklist_token(db, key, expiry_time=datetime.utcfromtimestamp(expiry_time))
+        db.commit()
+        revocation.revocation_filter.revoke(key)
 
     return {"msg": "Successfully logged out"}
 
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from .. import schemas, oauth2, models, crud, database
+from .. import schemas, oauth2, models, database, guest_cart
+from ..cart_store import get_cart_store
 
 router = APIRouter(
     prefix="/carts",
@@ -11,36 +12,91 @@ router = APIRouter(
 
 
 @router.get("/", response_model=schemas.Cart)
-def read_cart(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    db_cart = crud.get_cart(db, user_id=current_user.id)
+def read_cart(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    db_cart = store.get_cart(db, user_id=current_user.id)
     if db_cart is None:
         raise HTTPException(status_code=404, detail="Cart not found")
     return db_cart
 
+@router.get("/expanded/", response_model=schemas.ExpandedCart)
+def read_expanded_cart(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    expanded_cart = store.get_expanded_cart(db, user_id=current_user.id)
+    if expanded_cart is None:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    return expanded_cart
+
+def _guest_cart_response(lines: dict):
+    return schemas.GuestCart(items=[
+        schemas.GuestCartItem(product_id=product_id, quantity=quantity) for product_id, quantity in sorted(lines.items())
+    ])
+
+@router.get("/guest/", response_model=schemas.GuestCart)
+def read_guest_cart(guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
+    return _guest_cart_response(guest_cart.decode(guest_cart_token))
+
+@router.post("/guest/items/", response_model=schemas.GuestCart)
+def add_to_guest_cart(item: schemas.CartItemCreate, response: Response, db: Session = Depends(database.get_read_db),
+                      guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
+    # Validated like a signed-in add, but only read from the database
+    if item.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
+    lines = guest_cart.decode(guest_cart_token)
+    if item.product_id not in lines and len(lines) >= guest_cart.MAX_LINES:
+        raise HTTPException(status_code=400, detail="Guest cart is full, log in to add more products")
+    stock = db.query(models.Product.total_stock).filter(models.Product.id == item.product_id).scalar()
+    if stock is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if item.quantity > stock:
+        raise HTTPException(status_code=400, detail="Not enough stock available")
+    quantity = lines.get(item.product_id, 0) + item.quantity
+    if quantity > stock:
+        raise HTTPException(status_code=400, detail="Not enough stock for the total quantity")
+    lines[item.product_id] = quantity
+    guest_cart.set_cookie(response, lines)
+    return _guest_cart_response(lines)
+
+@router.delete("/guest/items/{product_id}", response_model=schemas.GuestCart)
+def remove_from_guest_cart(product_id: int, response: Response,
+                           guest_cart_token: Optional[str] = Cookie(None, alias=guest_cart.COOKIE_NAME)):
+    lines = guest_cart.decode(guest_cart_token)
+    if lines.pop(product_id, None) is None:
+        raise HTTPException(status_code=404, detail="Item not found in cart")
+    guest_cart.set_cookie(response, lines)
+    return _guest_cart_response(lines)
+
 @router.post("/items/", response_model=schemas.CartItem)
-def add_to_cart(item: schemas.CartItemCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+def add_to_cart(item: schemas.CartItemCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    if current_user.role in [models.UserRole.SELLER, models.UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Sellers are not allowed to create carts or place orders"
+        )
+    return store.add_item(db=db, item=item, user_id=current_user.id)
+
+@router.post("/batch/", response_model=schemas.Cart)
+def apply_cart_batch(batch: schemas.CartBatch, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
     if current_user.role in [models.UserRole.SELLER, models.UserRole.ADMIN]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Sellers are not allowed to create carts or place orders"
         )
-    return crud.add_item_to_cart(db=db, item=item, user_id=current_user.id)
+    return store.apply_batch(db=db, operations=batch.operations, user_id=current_user.id)
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_item_from_cart(item_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    return crud.remove_item_from_cart(db=db, item_id=item_id, user_id=current_user.id)
+def remove_item_from_cart(item_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    return store.remove_item(db=db, item_id=item_id, user_id=current_user.id)
 
 @router.put("/items/{item_id}", response_model=schemas.CartItem)
-def update_cart_item(item_id: int, item: schemas.CartItemUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    return crud.update_cart_item(db=db, item_id=item_id, item=item, user_id=current_user.id)
+def update_cart_item(item_id: int, item: schemas.CartItemUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    return store.update_item(db=db, item_id=item_id, item=item, user_id=current_user.id)
 
 @router.delete("/clear/", status_code=status.HTTP_204_NO_CONTENT)
-def clear_cart(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    return crud.clear_cart(db=db, user_id=current_user.id)
+def clear_cart(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    return store.clear(db=db, user_id=current_user.id)
 
-@router.get("/amount/", status_code=status.HTTP_200_OK)
-def get_cart_total(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    return f"Total price for your cart is {crud.get_cart_total(db=db, user_id=current_user.id)}"
+@router.get("/amount/", status_code=status.HTTP_200_OK, response_model=schemas.CartTotal)
+def get_cart_total(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user), store=Depends(get_cart_store)):
+    return store.get_total(db=db, user_id=current_user.id)
 
 
 # {
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends
+
+from .. import models, oauth2, utils
+from ..instrumentation import loop_lag_monitor, pool_metrics
+from ..slow_queries import slow_query_log
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=['Metrics']
+)
+
+admin_only = oauth2.get_user_with_roles([models.UserRole.ADMIN])
+
+
+@router.get("/hashing")
+def get_hashing_metrics(current_user: oauth2.Principal = Depends(admin_only)):
+    return utils.hashing_pool.stats()
+
+
+@router.get("/loop-lag")
+def get_loop_lag_metrics(current_user: oauth2.Principal = Depends(admin_only)):
+    return loop_lag_monitor.stats()
+
+
+@router.get("/pool")
+def get_pool_metrics(current_user: oauth2.Principal = Depends(admin_only)):
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+
+@router.get("/slow-queries")
+def get_slow_queries(limit: int = 50, current_user: oauth2.Principal = Depends(admin_only)):
+    return {"threshold_ms": slow_query_log.threshold_ms, "queries": slow_query_log.recent(limit)}
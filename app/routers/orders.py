@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from .. import crud, schemas, models, oauth2, database
+from ..cart_store import get_cart_store
 
 router = APIRouter(
     prefix="/orders",
@@ -13,7 +15,10 @@ router = APIRouter(
 def create_order(
     order: schemas.OrderCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(oauth2.get_current_user)
+    current_user: models.User = Depends(oauth2.get_current_user),
+    store=Depends(get_cart_store),
+    response: Response = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     allowed_roles = [models.UserRole.CUSTOMER]  # Only customers can place orders
     if current_user.role not in allowed_roles:
@@ -21,11 +26,30 @@ def create_order(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to place orders"
         )
+
+    # A retry of an order that was already placed gets the stored response back
+    if idempotency_key is not None:
+        request_hash = crud.request_hash(order.model_dump_json())
+        replay = crud.get_idempotent_response(db, current_user.id, idempotency_key, request_hash)
+        if replay is not None:
+            return _replayed(response, replay)
     
-    # Fetch cart
+    # Fetch cart, writing back any edits the cart store hasn't persisted yet
+    store.persist(db, user_id=current_user.id)
     cart = crud.get_cart(db, user_id=current_user.id)
     if not cart or not cart.items:
+        # ...unless a duplicate of this request emptied it a moment ago
+        if idempotency_key is not None:
+            replay = crud.get_idempotent_response(db, current_user.id, idempotency_key, request_hash)
+            if replay is not None:
+                return _replayed(response, replay)
         raise HTTPException(status_code=400, detail="Cart is empty")
+
+    # Concurrent duplicates wait here for the first request to finish
+    if idempotency_key is not None:
+        replay = crud.claim_idempotency_key(db, current_user.id, idempotency_key, request_hash)
+        if replay is not None:
+            return _replayed(response, replay)
     
     # Validate shipping address
     selected_address = crud.get_shipping_address(db, address_id=order.shipping_address_id, user_id=current_user.id)
@@ -42,27 +66,50 @@ def create_order(
             user_id=current_user.id,
             shipping_address_id=order.shipping_address_id,
             cart_items=cart.items,
+            idempotency_key=idempotency_key,
         )
-        crud.clear_cart(db=db, user_id=current_user.id)  # Clear cart after order creation
+        store.checked_out(db=db, user_id=current_user.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     return db_order
 
+def _replayed(response: Optional[Response], stored: dict):
+    if response is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+    return stored
+
 
 @router.get("/", response_model=List[schemas.Order])
-def get_orders(db: Session = Depends(database.get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+def get_orders(
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+    response: Response = None,
+    order_status: Optional[schemas.OrderStatus] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200)
+):
+    # One extra row tells whether there's a next page
+    page = dict(status=order_status, created_from=created_from, created_to=created_to,
+                after=crud.decode_order_cursor(cursor) if cursor else None, limit=limit + 1)
     if current_user.role == models.UserRole.CUSTOMER:
         # Customers only see their own orders
-        return crud.get_user_orders(db=db, user_id=current_user.id)
+        orders = crud.get_user_orders(db=db, user_id=current_user.id, **page)
     elif current_user.role == models.UserRole.SELLER:
         # Sellers see orders for their products
-        return crud.get_seller_orders(db=db, seller_id=current_user.id)
+        orders = crud.get_seller_orders(db=db, seller_id=current_user.id, **page)
     elif current_user.role == models.UserRole.ADMIN:
         # Admins can view all orders
-        return crud.get_all_orders(db=db)
+        orders = crud.get_all_orders(db=db, **page)
     else:
         raise HTTPException(status_code=403, detail="Invalid role")
+    if len(orders) > limit:
+        orders = orders[:limit]
+        if response is not None:
+            response.headers["X-Next-Cursor"] = crud.encode_order_cursor(orders[-1])
+    return orders
     
 @router.get("/{order_id}", response_model=schemas.Order)
 def get_order_by_id(
@@ -44,13 +44,28 @@ def update_product(
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+@router.put("/{id}/stock-shards", response_model=schemas.Product)
+def set_stock_shards(
+    id: int,
+    stock_shards: schemas.StockShards,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(oauth2.get_current_user)
+    ):
+    # Spreads a hot product's stock over several rows so checkouts don't queue on one
+    if current_user.role != models.UserRole.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform this action")
+    db_product = crud.get_product(db, id)
+    if db_product is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product with id: {id} does not exist")
+    return crud.set_stock_shards(db, db_product, stock_shards.shards)
+
 
 @router.get("/", response_model=List[schemas.Product])
 def get_all_products(
     skip: int = 0,
     limit: int = 100,
     include_inactive: bool = False,
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
     ):
     products = crud.get_products(db, skip=skip, limit=limit, include_inactive=include_inactive)
     if not products:
@@ -65,7 +80,7 @@ def search_products(
     max_price: Optional[float] = None,
     is_active: Optional[bool] = None,
     on_sale: Optional[bool] = Query(None, description="Filter for products currently on sale"),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
     ):
     
     if min_price is not None and max_price is not None and min_price > max_price:
@@ -79,7 +94,7 @@ def search_products(
 @router.get("/{id}", response_model=schemas.Product)
 def get_product_by_id(
     id: int = Path(..., gt=0),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
     ):
     product = crud.get_product(db, id)
     if not product:
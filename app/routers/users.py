@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List
 
-from .. import crud, schemas, database
+from .. import crud, schemas, database, utils
 
 router = APIRouter(
     prefix="/users",
@@ -10,11 +11,7 @@ router = APIRouter(
 )
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    # print("========", user.role)
-    # hash the password - user.password
-    db_user = crud.get_user_by_emailphone(db, email=user.email, phone_number=user.phone_number)
+def ensure_not_registered(db_user, user: schemas.UserCreate):
     if db_user:
         if db_user.email == user.email:
             raise HTTPException(status_code=400, detail="Email already registered")
@@ -22,9 +19,26 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
             raise HTTPException(status_code=400, detail="Phone Number already registered")
         else:
             raise HTTPException(status_code=400, detail="Credientials already registered")
-            
+
+async def hash_password(password: str) -> str:
+    # hash the password off the request thread
+    try:
+        return await utils.hash_async(password)
+    except utils.HashingPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many registrations in progress, please retry shortly",
+            headers={"Retry-After": "1"})
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.User)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+    # print("========", user.role)
+    db_user = await run_in_threadpool(crud.get_user_by_emailphone, db, email=user.email, phone_number=user.phone_number)
+    ensure_not_registered(db_user, user)
+    hashed_password = await hash_password(user.password)
     
-    return crud.create_user(db=db, user=user)
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @router.get('/', response_model=List[schemas.User])
 def get_users(db: Session = Depends(database.get_db)):
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, HttpUrl, field_validator, constr
-from typing import List, Optional
+from pydantic import AliasChoices, BaseModel, EmailStr, Field, HttpUrl, field_validator, constr
+from typing import List, Literal, Optional
 from enum import Enum
 from typing import List
 from datetime import datetime
@@ -51,6 +51,8 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     id: str
     role: Optional[str] = None
+    jti: Optional[str] = None
+    epoch: int = 0
 
 class ProductBase(BaseModel):
     name: str
@@ -115,6 +117,11 @@ class ProductUpdate(BaseModel):
 
 class Product(ProductBase):
     id: int
+    # Summed over the stock shards for a sharded product
+    stock: int = Field(validation_alias=AliasChoices("total_stock", "stock"))
+    stock_shards: int = 0
+    # stock less what live cart reservations hold
+    available_stock: int
     created_at: datetime
     updated_at: datetime
     owner_id: int
@@ -122,6 +129,10 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class StockShards(BaseModel):
+    # 0 collapses the shards back into the product row
+    shards: int = Field(..., ge=0, le=64)
+
 class CartItemBase(BaseModel):
     product_id: int
     quantity: int
@@ -138,10 +149,35 @@ class CartItem(CartItemBase):
     class Config:
         from_attributes = True
 
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: int
+    # Required for add and set; setting 0 removes the line
+    quantity: Optional[int] = None
+
+class CartBatch(BaseModel):
+    operations: List[CartOperation] = Field(..., max_length=500)
+
+class GuestCartItem(BaseModel):
+    product_id: int
+    quantity: int
+
+class GuestCart(BaseModel):
+    items: List[GuestCartItem] = []
+
 class CartTotal(BaseModel):
     total: float
     items_count: int
 
+class ExpandedCartItem(CartItem):
+    name: str
+    price: float
+    # Unit price the line is charged at, after discount
+    sale_price: float
+    stock: int
+    image_url: Optional[str] = None
+    subtotal: float
+
 class CartBase(BaseModel):
     items: List[CartItem] = []
 
@@ -155,6 +191,12 @@ class Cart(CartBase):
     class Config:
         from_attributes = True
 
+class ExpandedCart(BaseModel):
+    id: int
+    user_id: int
+    items: List[ExpandedCartItem] = []
+    total: float
+
 
 class ShippingAddressBase(BaseModel):
     address_line1: str
@@ -0,0 +1,162 @@
+"""
+Slow-query recorder.
+
+Statements that take longer than the threshold are kept in memory (and
+optionally appended to a rotating file) with their parameter shapes, never
+their values, and the route that ran them. A sample of slow plain table
+reads is re-run under EXPLAIN (ANALYZE, BUFFERS) on a background thread and
+a connection of its own, at most `explains_per_minute` times, so the plan
+is available next to the timing.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .instrumentation import current_scope, describe_scope
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS) "
+
+
+def parameter_shape(parameters):
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: the shape of one row and how many rows there were
+            return {"rows": len(parameters), "row": parameter_shape(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+# A FROM naming a table (or view), not a function call
+FROM_TABLE = re.compile(r'\bFROM\s+"?[A-Z_][\w$]*"?(?:\."?[A-Z_][\w$]*"?)?(?![\w$".(])(?!\s*\()')
+# Functions with side effects, e.g. a session-level pg_advisory_lock would stay held
+UNSAFE_FUNCTION = re.compile(r"\b(?:PG_\w+|NEXTVAL|SETVAL|LO_\w+|DBLINK\w*|SET_CONFIG)\s*\(")
+
+
+def explainable(statement: str) -> bool:
+    # ANALYZE executes the statement, so only plain table reads are re-run
+    statement = " ".join(statement.split()).upper()
+    return (
+        statement.startswith("SELECT")
+        and FROM_TABLE.search(statement) is not None
+        and UNSAFE_FUNCTION.search(statement) is None
+        and not any(clause in statement for clause in (" FOR UPDATE", " FOR NO KEY UPDATE", " FOR SHARE", " FOR KEY SHARE"))
+    )
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, history: int = 200, explain_sample_rate: float = 0.1,
+                 explains_per_minute: int = 6, log_file: str = ""):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explains_per_minute = explains_per_minute
+        self.entries = deque(maxlen=history)
+        self._explain_times = deque()
+        self._explaining = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._file_logger = None
+        if log_file:
+            # Not registered with logging, so it only ever has this one handler
+            self._file_logger = logging.Logger(f"{__name__}.file", logging.INFO)
+            self._file_logger.addHandler(RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5))
+
+    def attach(self, target=Engine):
+        event.listen(target, "before_cursor_execute", self._before)
+        event.listen(target, "after_cursor_execute", self._after)
+
+    def detach(self, target=Engine):
+        event.remove(target, "before_cursor_execute", self._before)
+        event.remove(target, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+        scope = current_scope.get()
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "duration_ms": round(elapsed_ms, 2),
+            "route": describe_scope(scope) if scope is not None else None,
+            "statement": statement,
+            "parameters": parameter_shape(parameters),
+            "plan": None,
+        }
+        self.entries.append(entry)
+        logger.warning("Slow query (%.0f ms) in %s: %s", elapsed_ms, entry["route"], " ".join(statement.split())[:200])
+        # The async engine's connections can't be used from a plain thread
+        if not executemany and not conn.dialect.is_async and explainable(statement) and self._take_explain_slot():
+            self._executor.submit(self._explain, conn.engine, entry, statement, parameters)
+        elif self._file_logger is not None:
+            self._file_logger.info(json.dumps(entry))
+
+    def _take_explain_slot(self) -> bool:
+        if random.random() >= self.explain_sample_rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            while self._explain_times and now - self._explain_times[0] > 60:
+                self._explain_times.popleft()
+            # One EXPLAIN at a time; slow queries arriving meanwhile aren't queued up
+            if self._explaining or len(self._explain_times) >= self.explains_per_minute:
+                return False
+            self._explain_times.append(now)
+            self._explaining = True
+            return True
+
+    def _explain(self, engine, entry, statement, parameters):
+        try:
+            # A fresh DBAPI connection outside the pool, closed afterwards, so
+            # the EXPLAIN isn't recorded and nothing it leaves behind on the
+            # session is handed to the app
+            cargs, cparams = engine.dialect.create_connect_args(engine.url)
+            connection = engine.dialect.connect(*cargs, **cparams)
+            try:
+                cursor = connection.cursor()
+                cursor.execute(EXPLAIN_PREFIX + statement, parameters)
+                entry["plan"] = "\n".join(row[0] for row in cursor.fetchall())
+                cursor.close()
+            finally:
+                connection.rollback()
+                connection.close()
+        except Exception:
+            logger.exception("Could not EXPLAIN slow query")
+        finally:
+            with self._lock:
+                self._explaining = False
+            if self._file_logger is not None:
+                self._file_logger.info(json.dumps(entry))
+
+    def recent(self, limit: int = 50):
+        return list(reversed(self.entries))[:limit]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.slow_query_ms,
+    history=settings.slow_query_history,
+    explain_sample_rate=settings.slow_query_explain_sample_rate,
+    explains_per_minute=settings.slow_query_explains_per_minute,
+    log_file=settings.slow_query_log_file,
+)
+if settings.slow_query_ms > 0:
+    slow_query_log.attach()
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+
+from .cart_store import cart_store
+from .config import settings
+from .crud import purge_expired_idempotency_keys, rebalance_stock_shards, sweep_expired_reservations
+from .database import SessionLocal
+from .revocation import purge_expired_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def run_with_session(job):
+    db = SessionLocal()
+    try:
+        return job(db)
+    finally:
+        db.close()
+
+
+async def run_periodically(job, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(run_with_session, job)
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+
+
+def start_background_jobs():
+    jobs = [
+        (purge_expired_tokens, settings.token_blacklist_purge_interval_seconds),
+        (rebalance_stock_shards, settings.stock_shard_rebalance_interval_seconds),
+        (purge_expired_idempotency_keys, settings.idempotency_key_purge_interval_seconds),
+    ]
+    if settings.stock_reservation_minutes > 0:
+        jobs.append((sweep_expired_reservations, settings.stock_reservation_sweep_interval_seconds))
+    if settings.cart_backend == "redis":
+        jobs.append((cart_store.flush_dirty, settings.cart_flush_interval_seconds))
+    return [asyncio.create_task(run_periodically(job, interval)) for job, interval in jobs]
+
+
+async def stop_background_jobs(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
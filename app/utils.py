@@ -1,9 +1,97 @@
-from passlib.context import CryptContext
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from .config import settings
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # Built on first use: importing passlib and loading the bcrypt backend
+    # is wasted startup time for workers that never check a password
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def hash(password: str):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+class HashingPoolBusy(Exception):
+    pass
+
+
+class HashingPool:
+    """
+    Runs bcrypt in worker processes so password checks neither block the
+    event loop nor tie up the threadpool shared by every sync route.
+    At most `workers + queue_size` jobs are accepted at once; beyond that
+    callers get HashingPoolBusy straight away instead of queueing.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise HashingPoolBusy()
+            self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": max(self.in_flight - self.workers, 0),
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+hashing_pool = HashingPool(
+    workers=settings.password_hash_workers or os.cpu_count() or 1,
+    queue_size=settings.password_hash_queue_size,
+)
+
+
+async def hash_async(password: str):
+    return await hashing_pool.run(hash, password)
+
+async def verify_async(plain_password, hashed_password):
+    return await hashing_pool.run(verify, plain_password, hashed_password)
@@ -0,0 +1,100 @@
+"""
+Concurrent load test for GET /products/ and POST /orders/ against a running server.
+
+Seeds the bench database, then drives it with --clients concurrent
+customers. Each one loops: list products, add an item to its cart, place
+an order. Run it once per server mode and compare, e.g.
+
+    DATABASE_NAME=ecommerce_bench DATABASE_ASYNC=false uvicorn app.main:app --workers 1
+    python -m benchmarks.async_load --base-url http://127.0.0.1:8000
+
+    DATABASE_NAME=ecommerce_bench DATABASE_ASYNC=true uvicorn app.main:app --workers 1
+    python -m benchmarks.async_load --base-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app import models
+
+from . import common
+
+
+def seed(clients):
+    common.reset_schema()
+    db = common.BenchSessionLocal()
+    try:
+        seller = common.create_user(db, models.UserRole.SELLER, 0)
+        products = common.create_products(db, seller.id, 50, stock=10_000_000)
+        customers = [common.create_user(db, models.UserRole.CUSTOMER, num) for num in range(1, clients + 1)]
+        addresses = [
+            models.ShippingAddress(user_id=c.id, street="1 Bench St", city="Bench", state="Bench",
+                                   postal_code="00000", country="Bench")
+            for c in customers
+        ]
+        db.add_all(addresses)
+        db.commit()
+        return [p.id for p in products], [(c.id, a.id) for c, a in zip(customers, addresses)]
+    finally:
+        db.close()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1] if len(samples) > 1 else samples[0]
+
+
+async def customer(http, user_id, address_id, product_id, deadline, latencies, errors):
+    headers = common.auth_headers(user_id)
+
+    async def timed(name, method, url, **kwargs):
+        start = time.perf_counter()
+        res = await http.request(method, url, headers=headers, **kwargs)
+        if res.status_code >= 400:
+            errors[name] = errors.get(name, 0) + 1
+        else:
+            latencies[name].append((time.perf_counter() - start) * 1000)
+
+    while time.perf_counter() < deadline:
+        await timed("GET /products/", "GET", "/products/")
+        await timed("POST /carts/items/", "POST", "/carts/items/", json={"product_id": product_id, "quantity": 1})
+        await timed("POST /orders/", "POST", "/orders/", json={"shipping_address_id": address_id})
+
+
+async def run(base_url, clients, duration, product_ids, customers):
+    latencies = {"GET /products/": [], "POST /carts/items/": [], "POST /orders/": []}
+    errors = {}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            customer(http, user_id, address_id, product_ids[i % len(product_ids)], deadline, latencies, errors)
+            for i, (user_id, address_id) in enumerate(customers)
+        ))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    args = parser.parse_args()
+
+    product_ids, customers = seed(args.clients)
+    latencies, errors = asyncio.run(run(args.base_url, args.clients, args.duration, product_ids, customers))
+
+    rows = []
+    for name, samples in latencies.items():
+        rows.append((name, f"{len(samples) / args.duration:,.0f} req/s  "
+                           f"p50 {percentile(samples, 50):,.1f} ms  p99 {percentile(samples, 99):,.1f} ms  "
+                           f"errors {errors.get(name, 0)}"))
+    common.report(f"{args.clients} concurrent clients for {args.duration:.0f}s against {args.base_url}", rows)
+
+
+if __name__ == "__main__":
+    main()
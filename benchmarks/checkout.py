@@ -0,0 +1,104 @@
+"""
+Parallel checkouts of scarce stock.
+
+Seeds --checkouts customers whose carts each hold one unit of every one of
+--products products (added in varying order), with only --stock units of
+each for sale, then runs every checkout at once through crud.create_order.
+Reports how many orders were placed and whether any product oversold.
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+
+from . import common
+
+
+def seed(checkouts, product_count, stock):
+    common.reset_schema()
+    db = common.BenchSessionLocal()
+    try:
+        seller = common.create_user(db, role=models.UserRole.SELLER, num=0)
+        products = common.create_products(db, seller.id, product_count, stock=stock)
+        customers = []
+        for num in range(1, checkouts + 1):
+            user = models.User(user_name=f"Bench customer {num}", email=f"bench{num}@customer.test",
+                               phone_number=f"{num:010d}", password=common.PASSWORD_HASH)
+            address = models.ShippingAddress(user=user, street="Street", city="City", state="State",
+                                             postal_code="00000", country="Country")
+            cart = models.Cart(user=user)
+            for product in random.sample(products, len(products)):
+                db.add(models.CartItem(cart=cart, product=product, quantity=1))
+            db.add(address)
+            customers.append((user, address))
+        db.commit()
+        return [(user.id, address.id) for user, address in customers], [product.id for product in products]
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkouts", type=int, default=200)
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=50, help="database connections shared by the checkouts")
+    args = parser.parse_args()
+
+    checkouts, product_ids = seed(args.checkouts, args.products, args.stock)
+    engine = create_engine(common.BENCH_DATABASE_URL, pool_size=args.connections, max_overflow=0, pool_timeout=300)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    start_line = threading.Barrier(args.checkouts)
+
+    def checkout(user_id, address_id):
+        db = SessionLocal()
+        try:
+            cart = crud.get_cart(db, user_id)
+            items = list(cart.items)
+            db.rollback()
+            start_line.wait()
+            crud.create_order(db, user_id, address_id, items)
+            return "placed"
+        except ValueError:
+            return "out of stock"
+        except DBAPIError as e:
+            db.rollback()
+            return type(e.orig).__name__
+        finally:
+            db.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.checkouts) as pool:
+        outcomes = list(pool.map(lambda args: checkout(*args), checkouts))
+    elapsed = time.perf_counter() - start
+
+    db = common.BenchSessionLocal()
+    try:
+        stock = dict(db.query(models.Product.id, models.Product.stock).all())
+        sold = dict(db.query(models.OrderItem.product_id, func.sum(models.OrderItem.quantity))
+                    .group_by(models.OrderItem.product_id).all())
+    finally:
+        db.close()
+    engine.dispose()
+
+    oversold = {product_id: sold.get(product_id, 0) - args.stock for product_id in product_ids
+                if sold.get(product_id, 0) > args.stock or stock[product_id] < 0}
+    rows = [(outcome, outcomes.count(outcome)) for outcome in sorted(set(outcomes))]
+    rows += [
+        ("units sold per product", sorted(set(sold.values()))),
+        ("stock left per product", sorted(set(stock.values()))),
+        ("oversold products", oversold or "none"),
+        ("wall time", f"{elapsed:.2f} s"),
+    ]
+    common.report(f"{args.checkouts} parallel checkouts, {args.products} products x {args.stock} units", rows)
+
+
+if __name__ == "__main__":
+    main()
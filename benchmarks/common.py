@@ -0,0 +1,118 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against ``<database_name>_bench`` so they never touch the
+development or test databases. Run them from the repository root, e.g.
+``python -m benchmarks.revocation_filter``.
+"""
+import time
+
+import psycopg2
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.database import Base, get_db, get_read_db
+from app.main import app
+from app.oauth2 import create_access_token
+
+BENCH_DATABASE_NAME = f'{settings.database_name}_bench'
+BENCH_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{BENCH_DATABASE_NAME}'
+
+# bcrypt hash of "password123", so seeding users doesn't pay for hashing
+PASSWORD_HASH = "$2b$12$MJAkviByDDx4jK2hotTT0u79w4sF.wFzVYtAUggtzrWn2yQrT6cGC"
+
+
+def ensure_database():
+    conn = psycopg2.connect(
+        host=settings.database_hostname or None,
+        port=settings.database_port,
+        user=settings.database_username,
+        password=settings.database_password,
+        dbname="postgres",
+    )
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DATABASE_NAME,))
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE DATABASE "{BENCH_DATABASE_NAME}"')
+    finally:
+        conn.close()
+
+
+ensure_database()
+engine = create_engine(BENCH_DATABASE_URL)
+BenchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def reset_schema():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def get_bench_db():
+    db = BenchSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def bench_client():
+    app.dependency_overrides[get_db] = get_bench_db
+    app.dependency_overrides[get_read_db] = get_bench_db
+    return TestClient(app)
+
+
+def create_user(db, role=models.UserRole.CUSTOMER, num=1):
+    user = models.User(
+        user_name=f"Bench {role} {num}",
+        email=f"bench{num}@{str(role).lower()}.test",
+        phone_number=f"{num:010d}",
+        password=PASSWORD_HASH,
+        role=role,
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def create_products(db, owner_id, count, stock=1000, price=10.0):
+    products = [
+        models.Product(
+            name=f"Bench product {i}",
+            price=price,
+            stock=stock,
+            category="Bench",
+            brand="Bench",
+            owner_id=owner_id,
+        )
+        for i in range(count)
+    ]
+    db.add_all(products)
+    db.commit()
+    return products
+
+
+def auth_headers(user_id):
+    return {"Authorization": f"Bearer {create_access_token({'user_id': user_id})}"}
+
+
+def requests_per_second(call, requests=2000, warmup=100):
+    for _ in range(warmup):
+        call()
+    start = time.perf_counter()
+    for _ in range(requests):
+        call()
+    return requests / (time.perf_counter() - start)
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"  {name:<{width}}  {value}")
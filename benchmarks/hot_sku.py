@@ -0,0 +1,106 @@
+"""
+Many parallel buyers of one product.
+
+Every buyer's cart holds one unit of the same product, with enough stock
+for all of them, and all checkouts start at once. A monitor polls
+pg_stat_activity while they run and adds up how long backends spent
+waiting on locks; the checkout latencies are reported alongside. With
+--shards the product's stock is spread over that many shard rows first.
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud
+
+from . import checkout, common
+
+LOCK_WAITERS = text(
+    "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND wait_event_type = 'Lock'")
+
+
+class LockWaitMonitor(threading.Thread):
+    def __init__(self, engine, interval=0.005):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.wait_seconds = 0.0
+        self.peak_waiters = 0
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        with self.engine.connect() as conn:
+            last = time.perf_counter()
+            while self.running.is_set():
+                waiters = conn.execute(LOCK_WAITERS).scalar()
+                conn.rollback()
+                now = time.perf_counter()
+                self.wait_seconds += waiters * (now - last)
+                self.peak_waiters = max(self.peak_waiters, waiters)
+                last = now
+                time.sleep(self.interval)
+
+    def stop(self):
+        self.running.clear()
+        self.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=50, help="database connections shared by the buyers")
+    parser.add_argument("--shards", type=int, default=0, help="stock shards for the product; 0 keeps one row")
+    args = parser.parse_args()
+
+    buyers, (product_id,) = checkout.seed(args.buyers, 1, stock=args.buyers)
+    if args.shards:
+        db = common.BenchSessionLocal()
+        try:
+            crud.shard_stock(db, product_id, args.shards)
+            db.commit()
+        finally:
+            db.close()
+    engine = create_engine(common.BENCH_DATABASE_URL, pool_size=args.connections, max_overflow=0, pool_timeout=300)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    start_line = threading.Barrier(args.buyers)
+
+    def buy(user_id, address_id):
+        db = SessionLocal()
+        try:
+            items = list(crud.get_cart(db, user_id).items)
+            db.rollback()
+            start_line.wait()
+            start = time.perf_counter()
+            crud.create_order(db, user_id, address_id, items)
+            return (time.perf_counter() - start) * 1000
+        finally:
+            db.close()
+
+    monitor = LockWaitMonitor(common.engine)
+    monitor.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.buyers) as pool:
+        latencies = sorted(pool.map(lambda args: buy(*args), buyers))
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+    engine.dispose()
+
+    shards = f", {args.shards} stock shards" if args.shards else ""
+    common.report(f"{args.buyers} parallel buyers of one product over {args.connections} connections{shards}", [
+        ("orders per second", f"{len(latencies) / elapsed:.0f}"),
+        ("checkout p50", f"{statistics.median(latencies):.1f} ms"),
+        ("checkout p95", f"{latencies[int(len(latencies) * 0.95) - 1]:.1f} ms"),
+        ("lock wait, all backends", f"{monitor.wait_seconds * 1000:.0f} ms"),
+        ("lock wait per order", f"{monitor.wait_seconds * 1000 / len(latencies):.2f} ms"),
+        ("peak backends waiting", monitor.peak_waiters),
+    ])
+
+
+if __name__ == "__main__":
+    main()
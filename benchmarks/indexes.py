@@ -0,0 +1,148 @@
+"""
+Latency of the crud functions behind the hot query shapes, with and without
+the indexes added in migration c5da86e21464.
+
+Seeds --scale x (1M products, 5M orders, 200k customers, 10k sellers) with
+generate_series, then times each function over random ids with the indexes
+dropped and again with them created. --scale 0.01 gives a quick run.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import crud, models
+from app.database import Base
+
+from . import common
+
+# ix_cart_items_cart_id_product_id has since become the uq_cart_items_cart_id_product_id
+# constraint, which stays in place for both runs
+NEW_INDEXES = [
+    'ix_order_items_order_id',
+    'ix_order_items_product_id',
+    'ix_products_owner_id',
+    'ix_orders_user_id',
+    'ix_shipping_addresses_user_id',
+    'ix_products_is_active_id',
+]
+
+SEED_SQL = [
+    """INSERT INTO users (user_name, email, phone_number, password, is_active, role, created_at)
+       SELECT 'Seller ' || i, 'seller' || i || '@bench.test', lpad(i::text, 10, '0'), :password, true,
+              'SELLER'::userrole, now()
+       FROM generate_series(1, :sellers) AS i""",
+    """INSERT INTO users (user_name, email, phone_number, password, is_active, role, created_at)
+       SELECT 'Customer ' || i, 'customer' || i || '@bench.test', lpad((:sellers + i)::text, 10, '0'), :password,
+              true, 'CUSTOMER'::userrole, now()
+       FROM generate_series(1, :customers) AS i""",
+    """INSERT INTO products (name, price, stock, is_active, category, brand, created_at, updated_at, owner_id)
+       SELECT 'Product ' || i, 10 + i % 90, 1000, i % 10 <> 0, 'Bench', 'Bench', now(), now(), 1 + i % :sellers
+       FROM generate_series(1, :products) AS i""",
+    """INSERT INTO shipping_addresses (user_id, street, city, state, postal_code, country, created_at)
+       SELECT :sellers + i, 'Street', 'City', 'State', '00000', 'Country', now()
+       FROM generate_series(1, :customers) AS i""",
+    """INSERT INTO carts (user_id) SELECT :sellers + i FROM generate_series(1, :customers) AS i""",
+    """INSERT INTO cart_items (cart_id, product_id, quantity)
+       SELECT c, 1 + (c * 3 + n) * 7919 % :products, 1
+       FROM generate_series(1, :customers) AS c, generate_series(0, 2) AS n
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO orders (user_id, status, shipping_address_id, total_price, created_at, updated_at)
+       SELECT :sellers + 1 + i % :customers, 'PENDING'::orderstatus, 1 + i % :customers, 10, now(), now()
+       FROM generate_series(1, :orders) AS i""",
+    """INSERT INTO order_items (order_id, product_id, quantity, price)
+       SELECT i, 1 + i * 7919 % :products, 1, 10
+       FROM generate_series(1, :orders) AS i""",
+]
+
+
+def dataset_sizes(scale):
+    return {
+        "sellers": max(int(10_000 * scale), 1),
+        "customers": max(int(200_000 * scale), 1),
+        "products": max(int(1_000_000 * scale), 1),
+        "orders": max(int(5_000_000 * scale), 1),
+    }
+
+
+def seed(sizes):
+    common.reset_schema()
+    with common.engine.begin() as conn:
+        for statement in SEED_SQL:
+            conn.execute(text(statement), {**sizes, "password": common.PASSWORD_HASH})
+
+
+def set_indexes(enabled):
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    with common.engine.begin() as conn:
+        for name in NEW_INDEXES:
+            if enabled:
+                indexes[name].create(conn, checkfirst=True)
+            else:
+                indexes[name].drop(conn, checkfirst=True)
+    with common.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def workload(sizes):
+    seller = lambda: random.randint(1, sizes["sellers"])
+    customer = lambda: sizes["sellers"] + random.randint(1, sizes["customers"])
+    order_id = lambda: random.randint(1, sizes["orders"])
+    return [
+        ("get_user_orders", lambda db: crud.get_user_orders(db, user_id=customer())),
+        ("get_seller_orders", lambda db: crud.get_seller_orders(db, seller_id=seller())),
+        ("is_seller_related_to_order", lambda db: crud.is_seller_related_to_order(db, user_id=seller(), order_id=order_id())),
+        ("get_order + items", lambda db: crud.get_order(db, order_id=order_id()).items),
+        ("get_cart + items", lambda db: crud.get_cart(db, user_id=customer()).items),
+        ("cart line lookup", lambda db: db.query(models.CartItem).filter(
+            models.CartItem.cart_id == random.randint(1, sizes["customers"]),
+            models.CartItem.product_id == random.randint(1, sizes["products"])).first()),
+        ("get_shipping_addresses", lambda db: crud.get_shipping_addresses(db, user_id=customer())),
+        ("get_products (page 50)", lambda db: crud.get_products(db, skip=5000, limit=100)),
+    ]
+
+
+def time_calls(call, calls):
+    db = common.BenchSessionLocal()
+    samples = []
+    try:
+        for _ in range(calls):
+            start = time.perf_counter()
+            call(db)
+            samples.append((time.perf_counter() - start) * 1000)
+            db.rollback()
+            db.expunge_all()
+    finally:
+        db.close()
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data from a previous run")
+    args = parser.parse_args()
+
+    sizes = dataset_sizes(args.scale)
+    if not args.skip_seed:
+        seed(sizes)
+    results = {}
+    for enabled in (False, True):
+        set_indexes(enabled)
+        for name, call in workload(sizes):
+            results.setdefault(name, []).append(time_calls(call, args.calls))
+
+    rows = [
+        (name, f"before p50 {before[0]:8.2f} ms  p95 {before[1]:8.2f} ms   "
+               f"after p50 {after[0]:8.2f} ms  p95 {after[1]:8.2f} ms")
+        for name, (before, after) in results.items()
+    ]
+    common.report(f"{sizes['products']:,} products, {sizes['orders']:,} orders, {args.calls} calls each", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Requests/sec on GET /carts/ with and without the in-process revocation filter.
+
+The blacklist is seeded with --blacklisted rows so the per-request lookup
+reflects a table that has been accumulating logouts.
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from app import models
+from app.config import settings
+from app.revocation import expiry_bucket, revocation_filter
+
+from . import common
+
+
+def seed(blacklisted):
+    common.reset_schema()
+    db = common.BenchSessionLocal()
+    try:
+        seller = common.create_user(db, models.UserRole.SELLER, 1)
+        customer = common.create_user(db, models.UserRole.CUSTOMER, 2)
+        products = common.create_products(db, seller.id, 5)
+        cart = models.Cart(user_id=customer.id)
+        db.add(cart)
+        db.commit()
+        db.add_all([models.CartItem(cart_id=cart.id, product_id=p.id, quantity=1) for p in products])
+
+        expiry = datetime.utcnow() + timedelta(hours=1)
+        db.bulk_insert_mappings(models.TokenBlacklist, [
+            {"token_key": f"revoked-{i:08d}", "expiry_time": expiry, "expiry_bucket": expiry_bucket(expiry)}
+            for i in range(blacklisted)
+        ])
+        db.commit()
+        return customer.id
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--blacklisted", type=int, default=100000)
+    args = parser.parse_args()
+
+    customer_id = seed(args.blacklisted)
+    client = common.bench_client()
+    headers = common.auth_headers(customer_id)
+
+    def call():
+        res = client.get("/carts/", headers=headers)
+        assert res.status_code == 200, res.text
+
+    rows = []
+    for enabled in (False, True):
+        settings.token_revocation_filter = enabled
+        revocation_filter.reset()
+        rps = common.requests_per_second(call, requests=args.requests)
+        rows.append(("filter on" if enabled else "filter off (DB lookup)", f"{rps:,.0f} req/s"))
+
+    common.report(f"GET /carts/ with {args.blacklisted:,} blacklisted tokens", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Worker startup cost: time to import app.main, and time from launching
+uvicorn until the first request is answered, for each schema startup mode.
+
+"create" matches the old behaviour of running create_all on every start.
+Every measurement runs in a fresh interpreter against the bench database.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from . import common
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def bench_env(mode):
+    return {**os.environ, "DATABASE_NAME": common.BENCH_DATABASE_NAME, "SCHEMA_STARTUP_MODE": mode}
+
+
+def import_seconds(mode):
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=bench_env(mode),
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_request_seconds(mode, timeout=30):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=bench_env(mode), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                time.sleep(0.01)
+        raise RuntimeError(f"server did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default="none,check,create")
+    args = parser.parse_args()
+
+    common.reset_schema()
+    rows = []
+    for mode in args.modes.split(","):
+        imports = [import_seconds(mode) for _ in range(args.runs)]
+        first = [first_request_seconds(mode) for _ in range(args.runs)]
+        rows.append((mode, f"import {statistics.median(imports) * 1000:,.0f} ms  "
+                           f"first request {statistics.median(first) * 1000:,.0f} ms"))
+    common.report(f"Worker startup, median of {args.runs} runs", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import models, oauth2, schemas
+from app.cart_store import get_cart_store
+from app.crud import aio
+from app.routers.aio import (addresses as aio_addresses, carts as aio_carts, orders as aio_orders,
+                             products as aio_products, users as aio_users)
+from .conftest import SQLALCHEMY_DATABASE_URL
+
+
+def run_async(test, session):
+    # Commit the fixtures so the async connection can see them
+    session.commit()
+
+    async def main():
+        engine = create_async_engine(SQLALCHEMY_DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1))
+        try:
+            async with async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as db:
+                return await test(db)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def principal(user):
+    return oauth2.Principal(id=user['id'], role=models.UserRole(user['role']), is_active=True, token_epoch=0)
+
+
+def test_aio_get_products(session, test_product):
+    products = run_async(lambda db: aio.get_products(db=db, skip=0, limit=10), session)
+    assert [p.id for p in products] == [test_product[0].id]
+    assert isinstance(products[0], schemas.Product)
+
+
+def test_aio_router_get_product_not_found(session, test_product):
+    with pytest.raises(HTTPException) as exc:
+        run_async(lambda db: aio_products.get_product_by_id(id=9999, db=db), session)
+    assert exc.value.status_code == 404
+
+
+def test_aio_router_set_stock_shards(session, test_user, test_product):
+    shirt, _ = test_product
+    admin, customer = test_user("ADMIN"), test_user("CUSTOMER")
+
+    async def shard(db):
+        with pytest.raises(HTTPException) as exc:
+            await aio_products.set_stock_shards(id=shirt.id, stock_shards=schemas.StockShards(shards=3), db=db,
+                                                current_user=principal(customer))
+        assert exc.value.status_code == 403
+        return await aio_products.set_stock_shards(id=shirt.id, stock_shards=schemas.StockShards(shards=3), db=db,
+                                                   current_user=principal(admin))
+
+    product = run_async(shard, session)
+    assert (product.stock, product.stock_shards) == (100, 3)
+
+
+def test_aio_router_create_order(session, authorized_client, test_user, test_product):
+    customer = test_user("CUSTOMER")
+    client = authorized_client(customer)
+    address = client.post("/shipping-addresses/", json={
+        "street": "123 Test St", "city": "Test City", "state": "Test State",
+        "country": "Test Country", "postal_code": "12345"}).json()
+    assert client.post("/carts/items/", json={"product_id": test_product[0].id, "quantity": 2}).status_code == 200
+
+    async def place_order(db):
+        order = await aio_orders.create_order(
+            order=schemas.OrderCreate(shipping_address_id=address['id']), db=db, current_user=principal(customer),
+            store=get_cart_store(), idempotency_key=None)
+        return order, await aio.get_user_orders(db=db, user_id=customer['id'])
+
+    order, orders = run_async(place_order, session)
+    assert order.items[0].product_id == test_product[0].id
+    assert [o.id for o in orders] == [order.id]
+
+
+def test_aio_routers_register_and_fill_a_cart(session, test_product):
+    shirt, _ = test_product
+    new_user = schemas.UserCreate(user_name="Async Customer", email="async@test.com", phone_number="5550001111",
+                                  password="password123")
+
+    async def shop(db):
+        user = await aio_users.create_user(user=new_user.model_copy(), db=db)
+        customer = principal({"id": user.id, "role": "CUSTOMER"})
+        with pytest.raises(HTTPException) as exc:
+            await aio_users.create_user(user=new_user.model_copy(), db=db)
+        assert exc.value.detail == "Email already registered"
+
+        address = await aio_addresses.create_shipping_address(
+            address=schemas.ShippingAddressCreate(street="1 St", city="City", state="State", country="Country",
+                                                  postal_code="12345"),
+            db=db, current_user=customer)
+        await aio_carts.add_to_cart(item=schemas.CartItemCreate(product_id=shirt.id, quantity=2), db=db,
+                                    current_user=customer, store=get_cart_store())
+        cart = await aio_carts.read_cart(db=db, current_user=customer, store=get_cart_store())
+        total = await aio_carts.get_cart_total(db=db, current_user=customer, store=get_cart_store())
+        addresses = await aio_addresses.get_shipping_addresses(db=db, current_user=customer)
+        return cart, total, addresses, address
+
+    cart, total, addresses, address = run_async(shop, session)
+    assert [(item.product_id, item.quantity) for item in cart.items] == [(shirt.id, 2)]
+    assert total.items_count == 2
+    assert [a.id for a in addresses] == [address.id]
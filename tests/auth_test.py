@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from jose import jwt
+
+from app import models, oauth2
+from app.config import settings
+from app.revocation import BloomFilter, blacklist_token, purge_expired_tokens, revocation_filter, token_key
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"token-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+def test_logout_revokes_token(authorized_client, test_user):
+    customer = test_user("CUSTOMER")
+    auth_client = authorized_client(customer)
+    assert auth_client.get("/shipping-addresses/").status_code == 200
+
+    res = auth_client.post("/logout/")
+    assert res.status_code == 200
+
+    res = auth_client.get("/shipping-addresses/")
+    assert res.status_code == 401
+    assert res.json()["detail"] == "Token is blacklisted, please log in again"
+
+def test_revocation_filter_sees_other_workers_logouts(session, authorized_client, test_user):
+    customer = test_user("CUSTOMER")
+    auth_client = authorized_client(customer)
+    assert auth_client.get("/shipping-addresses/").status_code == 200
+
+    # Simulate a logout handled by another worker: the row exists but this
+    # process never saw it, so only the periodic refresh can pick it up.
+    token = auth_client.headers["Authorization"].split(" ")[1]
+    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    blacklist_token(session, token_key(token, payload["jti"]), datetime.utcfromtimestamp(payload["exp"]))
+    session.commit()
+    revocation_filter._checked_at = 0.0
+
+    res = auth_client.get("/shipping-addresses/")
+    assert res.status_code == 401
+
+def test_logout_twice_is_not_an_error(authorized_client, test_user):
+    auth_client = authorized_client(test_user("CUSTOMER"))
+    assert auth_client.post("/logout/").status_code == 200
+    assert auth_client.post("/logout/").status_code == 200
+
+def test_blacklist_rows_are_keyed_by_jti(session, authorized_client, test_user):
+    auth_client = authorized_client(test_user("CUSTOMER"))
+    token = auth_client.headers["Authorization"].split(" ")[1]
+    auth_client.post("/logout/")
+
+    row = session.query(models.TokenBlacklist).one()
+    assert row.token_key == jwt.get_unverified_claims(token)["jti"]
+    assert len(row.token_key) <= 64
+
+def test_purge_drops_expired_buckets_only(session):
+    now = datetime.utcnow()
+    blacklist_token(session, "expired", now - timedelta(hours=2))
+    blacklist_token(session, "live", now + timedelta(hours=2))
+    session.commit()
+
+    assert purge_expired_tokens(session) == 1
+    assert [row.token_key for row in session.query(models.TokenBlacklist)] == ["live"]
+
+def test_role_change_invalidates_cached_principal(session, authorized_client, test_user):
+    customer = test_user("CUSTOMER")
+    auth_client = authorized_client(customer)
+    address_data = {
+        "street": "123 Test St",
+        "city": "Test City",
+        "state": "Test State",
+        "country": "Test Country",
+        "postal_code": "12345"
+    }
+    assert auth_client.post("/shipping-addresses/", json=address_data).status_code == 201
+
+    user = session.query(models.User).filter(models.User.id == customer["id"]).first()
+    user.role = models.UserRole.SELLER
+    session.commit()
+
+    res = auth_client.post("/shipping-addresses/", json=address_data)
+    assert res.status_code == 403
+
+def test_deactivation_invalidates_cached_principal(session, test_user):
+    customer = test_user("CUSTOMER")
+    assert oauth2.get_principal(session, customer["id"]).is_active
+
+    user = session.query(models.User).filter(models.User.id == customer["id"]).first()
+    user.is_active = False
+    session.commit()
+
+    assert not oauth2.get_principal(session, customer["id"]).is_active
+
+def test_epoch_logout_revokes_every_token_of_the_user(client, test_product_user, monkeypatch):
+    monkeypatch.setattr(settings, "token_revocation_mode", "epoch")
+    credentials = {"username": test_product_user['email'], "password": test_product_user['password']}
+    first = client.post("/login", data=credentials).json()["access_token"]
+    second = client.post("/login", data=credentials).json()["access_token"]
+    assert jwt.get_unverified_claims(first)["epoch"] == 0
+
+    res = client.post("/logout/", headers={"Authorization": f"Bearer {first}"})
+    assert res.status_code == 200
+
+    for token in (first, second):
+        res = client.get("/shipping-addresses/", headers={"Authorization": f"Bearer {token}"})
+        assert res.status_code == 401
+        assert res.json()["detail"] == "Token has been revoked, please log in again"
+
+    fresh = client.post("/login", data=credentials).json()["access_token"]
+    assert jwt.get_unverified_claims(fresh)["epoch"] == 1
+    res = client.get("/shipping-addresses/", headers={"Authorization": f"Bearer {fresh}"})
+    assert res.status_code == 200
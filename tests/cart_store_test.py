@@ -0,0 +1,122 @@
+import fakeredis
+import pytest
+
+from app import models
+from app.cart_store import DIRTY_KEY, RedisCartStore, get_cart_store
+from app.config import settings
+from app.main import app
+
+
+@pytest.fixture
+def redis_store(client):
+    store = RedisCartStore(fakeredis.FakeRedis(decode_responses=True))
+    app.dependency_overrides[get_cart_store] = lambda: store
+    yield store
+    app.dependency_overrides.pop(get_cart_store)
+
+
+def sql_lines(session):
+    session.expire_all()
+    return sorted((line.product_id, line.quantity) for line in session.query(models.CartItem).all())
+
+
+def test_redis_cart_edits_stay_out_of_postgres(authorized_client, test_user, test_product, redis_store, session, query_budget):
+    shirt, headphones = test_product
+    auth_client = authorized_client(test_user("CUSTOMER"))
+    assert auth_client.post("/carts/items/", json={"product_id": shirt.id, "quantity": 2}).status_code == 200
+
+    # Only the stock lookup touches the database once the cart is live in Redis
+    with query_budget(1):
+        res = auth_client.post("/carts/items/", json={"product_id": shirt.id, "quantity": 3})
+    assert res.status_code == 200
+    assert res.json() == {"id": shirt.id, "product_id": shirt.id, "quantity": 5}
+    assert auth_client.put(f"/carts/items/{shirt.id}", json={"quantity": 4}).json()["quantity"] == 4
+    assert auth_client.post("/carts/items/", json={"product_id": headphones.id, "quantity": 1}).status_code == 200
+    assert auth_client.delete(f"/carts/items/{headphones.id}").status_code == 204
+
+    assert [(line["product_id"], line["quantity"]) for line in auth_client.get("/carts/").json()["items"]] == [(shirt.id, 4)]
+    assert auth_client.get("/carts/amount/").json() == {"total": shirt.price * 4, "items_count": 4}
+    assert sql_lines(session) == []
+
+    assert redis_store.flush_dirty(session) == 1
+    assert sql_lines(session) == [(shirt.id, 4)]
+    assert redis_store.client.scard(DIRTY_KEY) == 0
+
+
+def test_redis_cart_errors_match_sql_backend(authorized_client, test_user, test_product, redis_store):
+    shirt, _ = test_product
+    auth_client = authorized_client(test_user("CUSTOMER"))
+    assert auth_client.get("/carts/").status_code == 404
+    assert auth_client.post("/carts/items/", json={"product_id": 9999, "quantity": 1}).status_code == 404
+
+    assert auth_client.post("/carts/items/", json={"product_id": shirt.id, "quantity": 60}).status_code == 200
+    res = auth_client.post("/carts/items/", json={"product_id": shirt.id, "quantity": 60})
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Not enough stock for the total quantity"
+    assert auth_client.put(f"/carts/items/{shirt.id}", json={"quantity": 101}).status_code == 400
+    assert auth_client.delete("/carts/items/9999").status_code == 404
+
+    res = auth_client.post("/carts/batch/", json={"operations": [
+        {"op": "remove", "product_id": shirt.id},
+        {"op": "add", "product_id": 9999, "quantity": 1},
+    ]})
+    assert res.status_code == 404
+    assert auth_client.get("/carts/").json()["items"][0]["quantity"] == 60
+
+
+def test_redis_cart_loads_existing_cart_and_flushes_at_checkout(authorized_client, test_user, test_cart, test_product, redis_store, session):
+    shirt, headphones = test_product
+    # Written through the SQL backend before Redis took over
+    app.dependency_overrides.pop(get_cart_store)
+    cart = test_cart([{"product_id": shirt.id, "quantity": 2}])
+    app.dependency_overrides[get_cart_store] = lambda: redis_store
+
+    auth_client = authorized_client(cart["user"])
+    res = auth_client.post("/carts/batch/", json={"operations": [{"op": "add", "product_id": headphones.id, "quantity": 3}]})
+    assert [(line["product_id"], line["quantity"]) for line in res.json()["items"]] == [(shirt.id, 2), (headphones.id, 3)]
+
+    address = auth_client.post("/shipping-addresses/", json={
+        "street": "123 Test St", "city": "Test City", "state": "Test State", "country": "Test Country", "postal_code": "12345",
+    }).json()
+    res = auth_client.post("/orders/", json={"shipping_address_id": address["id"]})
+    assert res.status_code == 200
+    assert sorted((item["product_id"], item["quantity"]) for item in res.json()["items"]) == [(shirt.id, 2), (headphones.id, 3)]
+
+    assert auth_client.get("/carts/").json()["items"] == []
+    redis_store.flush_dirty(session)
+    assert sql_lines(session) == []
+
+
+def test_redis_cart_merges_guest_cart_at_login(client, test_user, test_product, redis_store):
+    shirt, _ = test_product
+    customer = test_user("CUSTOMER")
+    client.post("/carts/guest/items/", json={"product_id": shirt.id, "quantity": 3})
+    assert client.post("/login", data={"username": customer["email"], "password": customer["password"]}).status_code == 200
+    assert redis_store._lines(customer["id"]) == {shirt.id: 3}
+
+
+def test_redis_cart_reserves_stock(authorized_client, test_user, test_product, redis_store, session, monkeypatch):
+    monkeypatch.setattr(settings, "stock_reservation_minutes", 15)
+    shirt, _ = test_product
+    first, second = test_user("CUSTOMER", 1), test_user("CUSTOMER", 2)
+
+    def reserved():
+        session.expire_all()
+        return session.get(models.Product, shirt.id).reserved_stock
+
+    assert authorized_client(first).post("/carts/items/", json={"product_id": shirt.id, "quantity": 60}).status_code == 200
+    assert authorized_client(second).post("/carts/items/", json={"product_id": shirt.id, "quantity": 50}).status_code == 400
+    assert authorized_client(second).post("/carts/items/", json={"product_id": shirt.id, "quantity": 40}).status_code == 200
+    assert reserved() == 100
+    assert authorized_client(first).put(f"/carts/items/{shirt.id}", json={"quantity": 30}).status_code == 200
+    assert reserved() == 70
+
+    # The holds are released whether the cart is cleared or checked out
+    authorized_client(first).delete("/carts/clear/")
+    assert reserved() == 40
+    address = authorized_client(second).post("/shipping-addresses/", json={
+        "street": "123 Test St", "city": "Test City", "state": "Test State", "country": "Test Country", "postal_code": "12345",
+    }).json()
+    assert authorized_client(second).post("/orders/", json={"shipping_address_id": address["id"]}).status_code == 200
+    assert reserved() == 0
+    assert session.query(models.StockReservation).count() == 0
@@ -1,4 +1,6 @@
-from app import crud
+import pytest
+
+from app import crud, guest_cart, models
 
 def test_read_cart(authorized_client, test_cart):
     cart = test_cart()
@@ -72,4 +74,165 @@ def test_get_cart_total(authorized_client, test_cart):
     ])
     res = authorized_client(cart["user"]).get("/carts/amount/")
     assert res.status_code == 200
-    assert "Total price for your cart is" in res.text
\ No newline at end of file
+    # Priced like order lines: discount_price is a percentage off
+    expected = 51 * 2 + crud.calculate_discounted_price(product_price=199.99, discount=149.99)
+    assert res.json() == {"total": pytest.approx(expected), "items_count": 3}
+
+def test_get_cart_total_without_cart(authorized_client, test_user):
+    res = authorized_client(test_user("CUSTOMER")).get("/carts/amount/")
+    assert res.status_code == 200
+    assert res.json() == {"total": 0, "items_count": 0}
+
+
+def test_add_same_product_increments_quantity(authorized_client, test_cart, test_product, query_budget):
+    cart = test_cart([{"product_id": test_product[0].id, "quantity": 2}])
+    auth_client = authorized_client(cart["user"])
+    with query_budget(1):
+        res = auth_client.post("/carts/items/", json={"product_id": test_product[0].id, "quantity": 3})
+    assert res.status_code == 200
+    assert res.json()["id"] == cart["items"][0]["id"]
+    assert res.json()["quantity"] == 5
+
+def test_add_to_cart_stock_errors(authorized_client, test_user, test_product):
+    auth_client = authorized_client(test_user("CUSTOMER"))
+    res = auth_client.post("/carts/items/", json={"product_id": 9999, "quantity": 1})
+    assert res.status_code == 404
+    assert res.json()["detail"] == "Product not found"
+
+    res = auth_client.post("/carts/items/", json={"product_id": test_product[0].id, "quantity": 101})
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Not enough stock available"
+
+    assert auth_client.post("/carts/items/", json={"product_id": test_product[0].id, "quantity": 60}).status_code == 200
+    res = auth_client.post("/carts/items/", json={"product_id": test_product[0].id, "quantity": 60})
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Not enough stock for the total quantity"
+    assert auth_client.get("/carts/").json()["items"][0]["quantity"] == 60
+
+def test_concurrent_adds_share_one_line(session, test_user, test_product):
+    from concurrent.futures import ThreadPoolExecutor
+    from app import models, schemas
+    from .conftest import TestingSessionLocal
+
+    customer = test_user("CUSTOMER")
+    session.commit()
+
+    def add(_):
+        db = TestingSessionLocal()
+        try:
+            crud.add_item_to_cart(db, schemas.CartItemCreate(product_id=test_product[0].id, quantity=1), customer['id'])
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add, range(8)))
+
+    session.expire_all()
+    lines = session.query(models.CartItem).all()
+    assert [line.quantity for line in lines] == [8]
+
+def test_read_expanded_cart(authorized_client, test_cart, sale_product, query_budget):
+    cart = test_cart([{"product_id": sale_product.id, "quantity": 2}])
+    auth_client = authorized_client(cart["user"])
+    with query_budget(2):
+        res = auth_client.get("/carts/expanded/")
+    assert res.status_code == 200
+    line = res.json()["items"][0]
+    sale_price = crud.calculate_discounted_price(product_price=sale_product.price, discount=sale_product.discount_price)
+    assert line["name"] == sale_product.name
+    assert line["price"] == sale_product.price
+    assert line["sale_price"] == sale_price
+    assert line["stock"] == sale_product.stock
+    assert line["subtotal"] == pytest.approx(sale_price * 2)
+    assert res.json()["total"] == pytest.approx(sale_price * 2)
+
+def test_read_expanded_cart_not_found(authorized_client, test_user):
+    res = authorized_client(test_user("CUSTOMER")).get("/carts/expanded/")
+    assert res.status_code == 404
+
+def test_apply_cart_batch(authorized_client, test_cart, test_product, query_budget):
+    shirt, headphones = test_product
+    cart = test_cart([{"product_id": shirt.id, "quantity": 2}, {"product_id": headphones.id, "quantity": 1}])
+    auth_client = authorized_client(cart["user"])
+    operations = [
+        {"op": "add", "product_id": shirt.id, "quantity": 3},
+        {"op": "add", "product_id": shirt.id, "quantity": 1},
+        {"op": "remove", "product_id": headphones.id},
+    ]
+    with query_budget(6):
+        res = auth_client.post("/carts/batch/", json={"operations": operations})
+    assert res.status_code == 200
+    assert [(line["product_id"], line["quantity"]) for line in res.json()["items"]] == [(shirt.id, 6)]
+
+    # set replaces whatever the earlier operations built up
+    operations = [
+        {"op": "add", "product_id": headphones.id, "quantity": 10},
+        {"op": "set", "product_id": headphones.id, "quantity": 4},
+        {"op": "set", "product_id": shirt.id, "quantity": 0},
+    ]
+    res = auth_client.post("/carts/batch/", json={"operations": operations})
+    assert [(line["product_id"], line["quantity"]) for line in res.json()["items"]] == [(headphones.id, 4)]
+
+def test_apply_cart_batch_is_all_or_nothing(authorized_client, test_cart, test_product):
+    shirt, headphones = test_product
+    cart = test_cart([{"product_id": shirt.id, "quantity": 2}])
+    auth_client = authorized_client(cart["user"])
+
+    res = auth_client.post("/carts/batch/", json={"operations": [
+        {"op": "remove", "product_id": shirt.id},
+        {"op": "add", "product_id": headphones.id, "quantity": 51},
+    ]})
+    assert res.status_code == 400
+    assert str(headphones.id) in res.json()["detail"]
+
+    res = auth_client.post("/carts/batch/", json={"operations": [
+        {"op": "add", "product_id": headphones.id, "quantity": 1},
+        {"op": "add", "product_id": 9999, "quantity": 1},
+    ]})
+    assert res.status_code == 404
+
+    res = auth_client.post("/carts/batch/", json={"operations": [{"op": "add", "product_id": shirt.id}]})
+    assert res.status_code == 400
+
+    assert [(line["product_id"], line["quantity"]) for line in auth_client.get("/carts/").json()["items"]] == [(shirt.id, 2)]
+
+def test_guest_cart_lives_in_a_signed_cookie(client, test_product, query_budget):
+    shirt, headphones = test_product
+    # One stock lookup and nothing written
+    with query_budget(1):
+        res = client.post("/carts/guest/items/", json={"product_id": shirt.id, "quantity": 2})
+    assert res.status_code == 200
+    client.post("/carts/guest/items/", json={"product_id": headphones.id, "quantity": 1})
+    assert client.post("/carts/guest/items/", json={"product_id": shirt.id, "quantity": 99}).status_code == 400
+    assert client.post("/carts/guest/items/", json={"product_id": 9999, "quantity": 1}).status_code == 404
+
+    with query_budget(0):
+        res = client.get("/carts/guest/")
+    assert res.json()["items"] == [
+        {"product_id": shirt.id, "quantity": 2}, {"product_id": headphones.id, "quantity": 1}]
+    assert client.delete(f"/carts/guest/items/{headphones.id}").json()["items"] == [{"product_id": shirt.id, "quantity": 2}]
+
+    # A tampered cookie reads as an empty cart
+    token = client.cookies["guest_cart"]
+    client.cookies.set("guest_cart", guest_cart.encode({shirt.id: 2})[:-2] + "xx")
+    assert client.get("/carts/guest/").json()["items"] == []
+    client.cookies.set("guest_cart", token)
+    assert client.get("/carts/guest/").json()["items"] == [{"product_id": shirt.id, "quantity": 2}]
+
+def test_login_merges_guest_cart(client, test_user, test_product, authorized_client, session):
+    shirt, headphones = test_product
+    customer = test_user("CUSTOMER")
+    auth_client = authorized_client(customer)
+    assert auth_client.post("/carts/items/", json={"product_id": shirt.id, "quantity": 60}).status_code == 200
+    client.headers.pop("Authorization")
+
+    client.post("/carts/guest/items/", json={"product_id": shirt.id, "quantity": 50})
+    client.post("/carts/guest/items/", json={"product_id": headphones.id, "quantity": 3})
+    res = client.post("/login", data={"username": customer["email"], "password": customer["password"]})
+    assert res.status_code == 200
+    assert "guest_cart" not in client.cookies
+
+    session.expire_all()
+    lines = session.query(models.CartItem).order_by(models.CartItem.product_id).all()
+    # Capped at the shirt's stock of 100
+    assert [(line.product_id, line.quantity) for line in lines] == [(shirt.id, 100), (headphones.id, 3)]
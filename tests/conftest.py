@@ -6,11 +6,14 @@ from sqlalchemy.ext.declarative import declarative_base
 from app.main import app
 
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.database import Base
-from app.oauth2 import create_access_token
+from app.oauth2 import create_access_token, principal_cache
+from app.revocation import revocation_filter
 from app import models
+from app.instrumentation import track_queries
 from alembic import command
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 
@@ -29,6 +32,8 @@ def session():
     # print("my session fixture ran")
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    revocation_filter.reset()
+    principal_cache.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -45,9 +50,28 @@ def client(session):
         finally:
             session.close()
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     yield TestClient(app)
 
 
+@pytest.fixture
+def query_budget():
+    """
+    `with query_budget(4): client.get(...)` fails the test if the block runs
+    more than 4 statements, or repeats one statement shape more than
+    `max_repeats` times (a query in a loop).
+    """
+    @contextmanager
+    def _query_budget(max_queries, max_repeats=None):
+        with track_queries(engine) as stats:
+            yield stats
+        statements = "\n".join(f"  {count} x {shape}" for shape, count in stats.shapes.most_common())
+        assert stats.count <= max_queries, f"{stats.count} queries, budget is {max_queries}:\n{statements}"
+        if max_repeats is not None:
+            assert not stats.repeated(max_repeats + 1), f"statement repeated more than {max_repeats} times:\n{statements}"
+    return _query_budget
+
+
 @pytest.fixture
 def authorized_client(client):
     def _get_authorized_client(user_fixture):
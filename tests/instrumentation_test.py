@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from app import instrumentation
+from app.instrumentation import Histogram, LoopLagMonitor, PoolMetrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((10, 100))
+    for value in (1, 50, 500):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert [bucket["count"] for bucket in snapshot["buckets"]] == [1, 2, 3]
+    assert snapshot["max"] == 500
+
+def test_loop_lag_monitor_reports_blocking_route(caplog):
+    class Route:
+        path = "/blocking/{id}"
+
+    async def blocking_handler():
+        instrumentation.in_flight[asyncio.current_task()] = {"method": "GET", "route": Route()}
+        try:
+            time.sleep(0.3)
+        finally:
+            instrumentation.in_flight.pop(asyncio.current_task())
+
+    async def scenario():
+        monitor = LoopLagMonitor(interval_ms=10, threshold_ms=100)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await blocking_handler()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    with caplog.at_level(logging.WARNING, logger="app.instrumentation"):
+        monitor = asyncio.run(scenario())
+
+    assert monitor.stalls == 1
+    assert monitor.histogram.snapshot()["max"] >= 250
+    assert "GET /blocking/{id}" in caplog.text
+
+def test_logout_does_not_block_the_event_loop():
+    from app.routers import auth
+    assert not asyncio.iscoroutinefunction(auth.logout)
+
+def test_pool_metrics_record_checkouts_and_waits():
+    from sqlalchemy import create_engine, exc
+    from sqlalchemy.pool import QueuePool
+    from .conftest import SQLALCHEMY_DATABASE_URL
+
+    metrics = PoolMetrics("pool-test", max_overflow=0)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=metrics.pool_class(QueuePool),
+                           pool_size=1, max_overflow=0, pool_timeout=0.1)
+    metrics.attach(engine)
+    try:
+        with engine.connect():
+            assert metrics.stats()["checked_out"] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        stats = metrics.stats()
+        assert stats["checked_out"] == 0
+        assert stats["peak_checked_out"] == 1
+        assert stats["timeouts"] == 1
+        assert stats["connects"] == 1
+        assert stats["checkout_latency_ms"]["count"] == 2
+        assert stats["wait_ms"]["count"] == 1
+        assert stats["wait_ms"]["max"] >= 100
+    finally:
+        engine.dispose()
+        instrumentation.pool_metrics.pop("pool-test")
+
+def test_pool_metrics_admin_only(authorized_client, test_user):
+    res = authorized_client(test_user("CUSTOMER")).get("/metrics/pool")
+    assert res.status_code == 403
+
+    res = authorized_client(test_user("ADMIN")).get("/metrics/pool")
+    assert res.status_code == 200
+    assert {"checked_out", "overflow", "checkout_latency_ms", "wait_ms"} <= res.json()["primary"].keys()
+
+def test_query_stats_flag_repeated_shapes():
+    stats = instrumentation.QueryStats()
+    for product_id in range(6):
+        stats.record("SELECT * FROM products\n WHERE id = %(id)s", 1.0)
+    stats.record("SELECT * FROM carts WHERE user_id = %(user_id)s", 2.0)
+    assert stats.count == 7
+    assert stats.total_ms == 8.0
+    assert stats.repeated(5) == [("SELECT * FROM products WHERE id = %(id)s", 6)]
+
+def test_query_stats_middleware_adds_headers(session, authorized_client, test_user, test_product):
+    from app.main import app
+    from fastapi.testclient import TestClient
+
+    middleware = instrumentation.QueryStatsMiddleware(app, n_plus_one_threshold=1)
+    client = TestClient(middleware)
+    client.headers.update(authorized_client(test_user("CUSTOMER")).headers)
+    res = client.get("/products/")
+    assert res.status_code == 200
+    assert res.headers["X-DB-Query-Count"] == "1"
+    assert float(res.headers["X-DB-Time-Ms"]) > 0
+    assert res.headers["X-DB-N-Plus-One"] == "1"
+
+def test_slow_query_log_records_shape_and_plan(session, tmp_path):
+    from sqlalchemy import text
+    from app.slow_queries import SlowQueryLog
+    from .conftest import engine
+
+    log_file = tmp_path / "slow.log"
+    recorder = SlowQueryLog(threshold_ms=0, explain_sample_rate=1, explains_per_minute=1, log_file=str(log_file))
+    recorder.attach(engine)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT id, CAST(:name AS text) FROM products"), {"name": "secret"})
+            conn.execute(text("SELECT 1"))
+    finally:
+        recorder.detach(engine)
+        recorder.close()
+
+    first, second = recorder.entries
+    assert first["parameters"] == {"name": "str"}
+    assert first["duration_ms"] > 0
+    assert "Execution Time" in first["plan"]
+    # Rate limited to one EXPLAIN per minute
+    assert second["plan"] is None
+    assert "secret" not in log_file.read_text()
+    assert len(log_file.read_text().splitlines()) == 2
+
+def test_slow_query_log_only_explains_plain_selects():
+    from app.slow_queries import explainable
+    assert explainable("SELECT * FROM products WHERE id = %(id)s")
+    assert not explainable("SELECT * FROM products WHERE id = %(id)s FOR UPDATE")
+    assert not explainable("UPDATE products SET stock = stock - 1")
+    # Function-only SELECTs and side-effecting functions are never re-run
+    assert not explainable("SELECT pg_advisory_lock(%(id)s)")
+    assert not explainable("SELECT 1")
+    assert not explainable("SELECT * FROM generate_series(1, 10)")
+    assert not explainable("SELECT nextval('orders_id_seq') FROM products")
+    assert not explainable("SELECT pg_try_advisory_lock(id) FROM products")
@@ -1,5 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
 import pytest
-from app import schemas, models
+from fastapi import Response
+
+from app import crud, schemas, models
+from app.cart_store import get_cart_store
+from app.routers import orders as orders_router
+from .conftest import TestingSessionLocal
 
 # Helper function to create a shipping address
 def create_test_address(authorized_client, user):
@@ -202,3 +210,144 @@ def test_cancel_other_users_order(authorized_client, test_user, test_product, te
     # Try to cancel the order as customer2
     res = authorized_client(customer2).patch(f"/orders/{order_id}/cancel")
     assert res.status_code == 403
+
+# Concurrent checkouts of the last units never oversell
+def test_concurrent_checkouts_do_not_oversell(session, test_product_user):
+    products = [models.Product(name=f"Scarce {i}", price=10, stock=5, category="Scarce", brand="Scarce",
+                               owner_id=test_product_user['id']) for i in range(2)]
+    session.add_all(products)
+    customers = []
+    for i in range(8):
+        user = models.User(user_name=f"Buyer {i}", email=f"buyer{i}@test.com", phone_number=f"9{i:09d}",
+                           password="x", role=models.UserRole.CUSTOMER)
+        address = models.ShippingAddress(user=user, street="1 St", city="City", state="State",
+                                         postal_code="12345", country="Country")
+        cart = models.Cart(user=user)
+        # Opposite line orders, so unordered locking could deadlock
+        for product in (products if i % 2 else reversed(products)):
+            session.add(models.CartItem(cart=cart, product=product, quantity=1))
+        session.add(address)
+        customers.append((user, address))
+    session.commit()
+    checkouts = [(user.id, address.id) for user, address in customers]
+
+    def checkout(args):
+        user_id, address_id = args
+        db = TestingSessionLocal()
+        try:
+            cart = crud.get_cart(db, user_id)
+            crud.create_order(db, user_id, address_id, cart.items)
+            return True
+        except ValueError:
+            return False
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        placed = list(pool.map(checkout, checkouts))
+
+    session.expire_all()
+    assert placed.count(True) == 5
+    assert [product.stock for product in session.query(models.Product).filter(models.Product.category == "Scarce")] == [0, 0]
+    assert session.query(models.OrderItem).count() == 10
+
+# Cancelling restocks once, however many times it is attempted
+def test_cancel_order_restocks_once(session, authorized_client, test_user, test_product, test_cart):
+    customer = test_user("CUSTOMER")
+    address = create_test_address(authorized_client, customer)
+    create_test_cart(authorized_client, customer, test_product)
+    order_id = authorized_client(customer).post("/orders/", json={"shipping_address_id": address["id"]}).json()["id"]
+
+    crud.cancel_order(session, order_id)
+    with pytest.raises(ValueError):
+        crud.cancel_order(session, order_id)
+    session.expire_all()
+    assert session.get(models.Product, test_product[0].id).stock == 100
+
+# Retries with the same Idempotency-Key replay the first order
+def test_create_order_idempotency_key(session, authorized_client, test_user, test_product, test_cart):
+    customer = test_user("CUSTOMER")
+    address = create_test_address(authorized_client, customer)
+    create_test_cart(authorized_client, customer, test_product)
+    client = authorized_client(customer)
+    headers = {"Idempotency-Key": "checkout-1"}
+
+    first = client.post("/orders/", json={"shipping_address_id": address["id"]}, headers=headers)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    retry = client.post("/orders/", json={"shipping_address_id": address["id"]}, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+
+    session.expire_all()
+    assert session.query(models.Order).count() == 1
+    assert session.get(models.Product, test_product[0].id).stock == 98
+
+    other = create_test_address(authorized_client, customer)
+    res = client.post("/orders/", json={"shipping_address_id": other["id"]}, headers=headers)
+    assert res.status_code == 422
+
+# Concurrent duplicates wait for the first and replay its result
+def test_concurrent_duplicate_orders_place_one(session, test_user, test_product):
+    shirt, _ = test_product
+    customer = session.get(models.User, test_user("CUSTOMER")["id"])
+    address = models.ShippingAddress(user=customer, street="1 St", city="City", state="State",
+                                     postal_code="12345", country="Country")
+    session.add(models.CartItem(cart=models.Cart(user=customer), product=shirt, quantity=3))
+    session.add(address)
+    session.commit()
+
+    def place(_):
+        db = TestingSessionLocal()
+        response = Response()
+        try:
+            order = orders_router.create_order(order=schemas.OrderCreate(shipping_address_id=address.id), db=db,
+                                               current_user=customer, store=get_cart_store(), response=response,
+                                               idempotency_key="double-tap")
+            return schemas.Order.model_validate(order).id, response.headers.get("Idempotent-Replayed")
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(place, range(6)))
+
+    assert len({order_id for order_id, _ in results}) == 1
+    assert [replayed for _, replayed in results].count(None) == 1
+    session.expire_all()
+    assert session.query(models.Order).count() == 1
+    assert session.get(models.Product, shirt.id).stock == 97
+
+# Order listings page newest first by (created_at, id)
+def test_get_orders_pages_with_cursor(session, authorized_client, test_user, test_product):
+    customer = test_user("CUSTOMER")
+    address = create_test_address(authorized_client, customer)
+    start = datetime(2026, 1, 1)
+    # Two orders share a timestamp, so the id breaks the tie
+    stamps = [start, start + timedelta(days=1), start + timedelta(days=1), start + timedelta(days=2), start + timedelta(days=3)]
+    orders = []
+    for i, created_at in enumerate(stamps):
+        order = models.Order(user_id=customer["id"], shipping_address_id=address["id"], total_price=10,
+                             created_at=created_at, status=models.OrderStatus.SHIPPED if i % 2 else models.OrderStatus.PENDING)
+        order.items.append(models.OrderItem(product_id=test_product[0].id, quantity=1, price=10))
+        orders.append(order)
+    session.add_all(orders)
+    session.commit()
+    newest_first = [order.id for order in sorted(orders, key=lambda order: (order.created_at, order.id), reverse=True)]
+
+    client = authorized_client(customer)
+    seen, cursor = [], None
+    while True:
+        res = client.get("/orders/", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert res.status_code == 200
+        seen += [order["id"] for order in res.json()]
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == newest_first
+
+    res = client.get("/orders/", params={"status": "SHIPPED"})
+    assert [order["id"] for order in res.json()] == [orders[3].id, orders[1].id]
+    res = client.get("/orders/", params={"created_from": "2026-01-02T00:00:00", "created_to": "2026-01-04T00:00:00"})
+    assert [order["id"] for order in res.json()] == newest_first[1:4]
+    assert client.get("/orders/", params={"cursor": "not-a-cursor"}).status_code == 400
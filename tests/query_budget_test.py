@@ -0,0 +1,73 @@
+import pytest
+
+from app import models
+from .orders_test import create_test_address
+
+# Statement budgets per endpoint for a cart of CART_SIZE products. A change
+# that adds queries (often a lazy load or a query in a loop) fails here;
+# lower the budget when an endpoint gets cheaper.
+CART_SIZE = 5
+
+
+@pytest.fixture
+def shopper(session, authorized_client, test_user, test_product_user):
+    products = [
+        models.Product(name=f"Budget product {i}", price=10, stock=10, category="Budget", brand="Budget",
+                       owner_id=test_product_user['id'])
+        for i in range(CART_SIZE)
+    ]
+    session.add_all(products)
+    session.commit()
+
+    customer = test_user("CUSTOMER")
+    client = authorized_client(customer)
+    address = create_test_address(authorized_client, customer)
+    for product in products:
+        res = client.post("/carts/items/", json={"product_id": product.id, "quantity": 1})
+        assert res.status_code == 200
+    return client, address
+
+
+def test_read_cart_budget(shopper, query_budget):
+    client, _ = shopper
+    with query_budget(2, max_repeats=1):
+        assert client.get("/carts/").status_code == 200
+
+def test_cart_total_budget(shopper, query_budget):
+    client, _ = shopper
+    with query_budget(1):
+        assert client.get("/carts/amount/").status_code == 200
+
+def test_list_products_budget(shopper, query_budget):
+    client, _ = shopper
+    with query_budget(1):
+        assert client.get("/products/").status_code == 200
+
+def test_create_order_budget(shopper, query_budget):
+    client, address = shopper
+    with query_budget(9, max_repeats=2):
+        assert client.post("/orders/", json={"shipping_address_id": address["id"]}).status_code == 200
+
+def test_list_orders_budget(shopper, query_budget):
+    client, address = shopper
+    assert client.post("/orders/", json={"shipping_address_id": address["id"]}).status_code == 200
+    with query_budget(2, max_repeats=1):
+        assert client.get("/orders/").status_code == 200
+
+def test_cancel_order_budget(shopper, query_budget):
+    client, address = shopper
+    order = client.post("/orders/", json={"shipping_address_id": address["id"]}).json()
+    with query_budget(4, max_repeats=1):
+        assert client.patch(f"/orders/{order['id']}/cancel").status_code == 200
+
+def test_list_orders_page_budget(shopper, session, query_budget):
+    client, address = shopper
+    user_id = session.get(models.ShippingAddress, address["id"]).user_id
+    product_id = session.query(models.Product.id).filter(models.Product.category == "Budget").first()[0]
+    for _ in range(CART_SIZE):
+        order = models.Order(user_id=user_id, shipping_address_id=address["id"], total_price=10)
+        order.items.append(models.OrderItem(product_id=product_id, quantity=1, price=10))
+        session.add(order)
+    session.commit()
+    with query_budget(2, max_repeats=1):
+        assert len(client.get("/orders/").json()) == CART_SIZE
@@ -0,0 +1,100 @@
+import itertools
+
+import psycopg2
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models
+from app.config import settings
+from app.database import Base, get_db, get_read_db
+from app.main import app
+from .conftest import TestingSessionLocal
+
+REPLICA_DATABASE_NAME = f'{settings.database_name}_test_replica'
+# Point REPLICA_DATABASE_URL at a second Postgres instance to test real replication lag;
+# by default a second database on the same server stands in for the replica.
+REPLICA_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{REPLICA_DATABASE_NAME}'
+
+
+@pytest.fixture(scope="module")
+def replica_engine():
+    conn = psycopg2.connect(host=settings.database_hostname or None, port=settings.database_port,
+                            user=settings.database_username, password=settings.database_password, dbname="postgres")
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (REPLICA_DATABASE_NAME,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE "{REPLICA_DATABASE_NAME}"')
+    conn.close()
+    engine = create_engine(REPLICA_DATABASE_URL)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def replica(client, replica_engine, monkeypatch):
+    Base.metadata.drop_all(bind=replica_engine)
+    Base.metadata.create_all(bind=replica_engine)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+    db = ReplicaSessionLocal()
+    seller = models.User(user_name="Replica Seller", email="seller@replica.test", phone_number="1111111111",
+                         password="x", role=models.UserRole.SELLER)
+    db.add(seller)
+    db.commit()
+    db.add(models.Product(name="Replica Product", price=10, stock=5, category="Replica", brand="Replica",
+                          owner_id=seller.id))
+    db.commit()
+    db.close()
+
+    # Route through the real dependencies: primary is the test database
+    monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(database, "replica_sessions", [ReplicaSessionLocal])
+    monkeypatch.setattr(database, "_next_replica", itertools.cycle(range(1)))
+    app.dependency_overrides.pop(get_db)
+    app.dependency_overrides.pop(get_read_db)
+    return ReplicaSessionLocal
+
+
+def product_names(res):
+    assert res.status_code == 200
+    return [p["name"] for p in res.json()]
+
+
+def test_reads_go_to_replica(session, test_product, replica, client):
+    assert product_names(client.get("/products/")) == ["Replica Product"]
+
+def test_writer_is_pinned_to_primary(session, test_user, test_product, replica, client, authorized_client):
+    customer = test_user("CUSTOMER")
+    auth_client = authorized_client(customer)
+    assert product_names(auth_client.get("/products/")) == ["Replica Product"]
+
+    res = auth_client.post("/carts/items/", json={"product_id": test_product[0].id, "quantity": 1})
+    assert res.status_code == 200
+
+    # The pin travels in a cookie, so any worker keeps the writer on the primary
+    assert product_names(auth_client.get("/products/")) == ["Classic T-Shirt"]
+    pin = auth_client.cookies["primary_pin"]
+    auth_client.cookies.set("primary_pin", pin[:-2] + "xx")
+    assert product_names(auth_client.get("/products/")) == ["Replica Product"]
+    auth_client.cookies.set("primary_pin", pin)
+    # Other users keep reading from the replica
+    del client.headers["Authorization"]
+    assert product_names(client.get("/products/")) == ["Replica Product"]
+
+def test_round_robin_over_replicas(monkeypatch):
+    replicas = [sessionmaker(info={"replica": i}) for i in range(2)]
+    monkeypatch.setattr(database, "replica_sessions", replicas)
+    monkeypatch.setattr(database, "_next_replica", itertools.cycle(range(2)))
+
+    class Request:
+        headers = {}
+        cookies = {}
+
+    used = []
+    for _ in range(4):
+        dependency = get_read_db(Request())
+        used.append(next(dependency).info["replica"])
+        dependency.close()
+    assert used == [0, 1, 0, 1]
@@ -0,0 +1,155 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app import crud, models
+from app.config import settings
+from .conftest import TestingSessionLocal
+
+
+@pytest.fixture(autouse=True)
+def reservations(monkeypatch):
+    monkeypatch.setattr(settings, "stock_reservation_minutes", 15)
+
+
+def product_stock(session, product):
+    session.expire_all()
+    product = session.get(models.Product, product.id)
+    return product.stock, product.reserved_stock
+
+
+def test_reservations_hold_stock_for_other_carts(authorized_client, test_user, test_product, session):
+    shirt, _ = test_product
+    first, second = test_user("CUSTOMER", 1), test_user("CUSTOMER", 2)
+
+    assert authorized_client(first).post("/carts/items/", json={"product_id": shirt.id, "quantity": 60}).status_code == 200
+    res = authorized_client(second).post("/carts/items/", json={"product_id": shirt.id, "quantity": 50})
+    assert res.status_code == 400
+    assert authorized_client(second).post("/carts/items/", json={"product_id": shirt.id, "quantity": 40}).status_code == 200
+    assert product_stock(session, shirt) == (100, 100)
+    assert authorized_client(second).get(f"/products/{shirt.id}").json()["available_stock"] == 0
+
+    # Lowering a line hands the difference back
+    line = authorized_client(first).get("/carts/").json()["items"][0]
+    assert authorized_client(first).put(f"/carts/items/{line['id']}", json={"quantity": 30}).status_code == 200
+    assert product_stock(session, shirt) == (100, 70)
+
+    address = authorized_client(first).post("/shipping-addresses/", json={
+        "street": "123 Test St", "city": "Test City", "state": "Test State", "country": "Test Country", "postal_code": "12345",
+    }).json()
+    assert authorized_client(first).post("/orders/", json={"shipping_address_id": address["id"]}).status_code == 200
+    assert product_stock(session, shirt) == (70, 40)
+    assert session.query(models.StockReservation).count() == 1
+
+
+def test_expired_reservations_are_swept(authorized_client, test_user, test_product, session):
+    shirt, headphones = test_product
+    customer = test_user("CUSTOMER")
+    authorized_client(customer).post("/carts/batch/", json={"operations": [
+        {"op": "add", "product_id": shirt.id, "quantity": 5},
+        {"op": "add", "product_id": headphones.id, "quantity": 2},
+    ]})
+    assert product_stock(session, shirt) == (100, 5)
+
+    session.query(models.StockReservation).filter(models.StockReservation.product_id == shirt.id).update(
+        {"expires_at": datetime.utcnow() - timedelta(minutes=1)})
+    session.commit()
+    assert crud.sweep_expired_reservations(session) == 1
+    assert product_stock(session, shirt) == (100, 0)
+    assert product_stock(session, headphones) == (50, 2)
+
+    # The line stays in the cart; clearing it releases what's still held
+    assert len(authorized_client(customer).get("/carts/").json()["items"]) == 2
+    authorized_client(customer).delete("/carts/clear/")
+    assert product_stock(session, headphones) == (50, 0)
+    assert session.query(models.StockReservation).count() == 0
+
+
+def test_login_merge_reserves_what_other_carts_leave(client, authorized_client, test_user, test_product, session):
+    shirt, headphones = test_product
+    customer, other = test_user("CUSTOMER", 1), test_user("CUSTOMER", 2)
+    assert authorized_client(other).post("/carts/items/", json={"product_id": shirt.id, "quantity": 30}).status_code == 200
+    assert authorized_client(customer).post("/carts/items/", json={"product_id": shirt.id, "quantity": 60}).status_code == 200
+    client.headers.pop("Authorization")
+
+    client.post("/carts/guest/items/", json={"product_id": shirt.id, "quantity": 50})
+    client.post("/carts/guest/items/", json={"product_id": headphones.id, "quantity": 3})
+    assert client.post("/login", data={"username": customer["email"], "password": customer["password"]}).status_code == 200
+
+    # The shirt is capped at the 70 the other cart doesn't hold
+    lines = authorized_client(customer).get("/carts/").json()["items"]
+    assert sorted((line["product_id"], line["quantity"]) for line in lines) == [(shirt.id, 70), (headphones.id, 3)]
+    assert product_stock(session, shirt) == (100, 100)
+    assert product_stock(session, headphones) == (50, 3)
+
+
+def test_reservations_lock_products_in_id_order(session, test_user, test_product):
+    shirt, headphones = test_product
+    first, second = (models.Cart(user_id=test_user("CUSTOMER", num)["id"]) for num in (1, 2))
+    session.add_all([first, second])
+    session.commit()
+
+    holder, other = TestingSessionLocal(), TestingSessionLocal()
+    try:
+        crud.reserve_stock(holder, first.id, {shirt.id: 1})
+        # The second cart asks for its products in descending order
+        waiter = threading.Thread(target=lambda: (
+            crud.reserve_stock(other, second.id, {headphones.id: 1, shirt.id: 1}), other.commit()))
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while not session.execute(text(
+                "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")).scalar():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+            session.rollback()
+        # Waiting on the shirt, it must not already hold the headphones
+        crud.reserve_stock(holder, first.id, {shirt.id: 1, headphones.id: 1})
+        holder.commit()
+        waiter.join()
+    finally:
+        holder.close()
+        other.close()
+    assert product_stock(session, shirt) == (100, 2)
+    assert product_stock(session, headphones) == (50, 2)
+
+
+def test_checkout_locks_products_in_id_order(session, test_user, test_product):
+    shirt, headphones = test_product
+    buyer, other = (session.get(models.User, test_user("CUSTOMER", num)["id"]) for num in (1, 2))
+    address = models.ShippingAddress(user=buyer, street="1 St", city="City", state="State",
+                                     postal_code="12345", country="Country")
+    cart, other_cart = models.Cart(user=buyer), models.Cart(user=other)
+    session.add_all([address, other_cart,
+                     models.CartItem(cart=cart, product=shirt, quantity=2),
+                     models.CartItem(cart=cart, product=headphones, quantity=3)])
+    session.flush()
+    # The shirt's hold has lapsed, so the release only touches the headphones
+    crud.reserve_stock(session, cart.id, {headphones.id: 3})
+    session.commit()
+
+    holder, buyer_db = TestingSessionLocal(), TestingSessionLocal()
+    placed = []
+    try:
+        crud.reserve_stock(holder, other_cart.id, {shirt.id: 1})
+        checkout = threading.Thread(target=lambda: placed.append(crud.create_order(
+            buyer_db, buyer.id, address.id, crud.get_cart(buyer_db, buyer.id).items)))
+        checkout.start()
+        deadline = time.monotonic() + 5
+        while not session.execute(text(
+                "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")).scalar():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+            session.rollback()
+        # Waiting on the shirt, the checkout must not already hold the headphones
+        crud.reserve_stock(holder, other_cart.id, {shirt.id: 1, headphones.id: 1})
+        holder.commit()
+        checkout.join()
+    finally:
+        holder.close()
+        buyer_db.close()
+    assert len(placed) == 1
+    assert product_stock(session, shirt) == (98, 1)
+    assert product_stock(session, headphones) == (47, 1)
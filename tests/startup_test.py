@@ -0,0 +1,24 @@
+import logging
+import subprocess
+import sys
+
+from app import migrations
+from .conftest import engine
+
+
+def test_importing_app_does_not_touch_database():
+    code = (
+        "import app.main, sys\n"
+        "from app.instrumentation import pool_metrics\n"
+        "sys.modules.get('passlib.context') and sys.exit('passlib imported')\n"
+        "print(pool_metrics['primary'].connects)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "0"
+
+def test_schema_check_warns_on_unmigrated_database(session, caplog):
+    # The test database is built with create_all, so it has no Alembic revision
+    with caplog.at_level(logging.WARNING, logger="app.migrations"):
+        assert migrations.check_schema(engine) is False
+    assert "run `alembic upgrade head`" in caplog.text
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import crud, models
+from .conftest import TestingSessionLocal
+
+
+def shard_stocks(session, product_id):
+    session.expire_all()
+    return [shard.stock for shard in session.query(models.ProductStockShard)
+            .filter(models.ProductStockShard.product_id == product_id).order_by(models.ProductStockShard.shard)]
+
+
+def test_sharded_stock_reads_as_the_sum(authorized_client, test_user, test_product, session):
+    shirt, _ = test_product
+    admin, customer = test_user("ADMIN"), test_user("CUSTOMER", 1)
+
+    assert authorized_client(customer).put(f"/products/{shirt.id}/stock-shards", json={"shards": 4}).status_code == 403
+    res = authorized_client(admin).put(f"/products/{shirt.id}/stock-shards", json={"shards": 3})
+    assert res.status_code == 200
+    assert (res.json()["stock"], res.json()["stock_shards"]) == (100, 3)
+    assert shard_stocks(session, shirt.id) == [34, 33, 33]
+
+    # Checkout takes from the shards, cancelling puts the units back
+    authorized_client(customer).post("/carts/items/", json={"product_id": shirt.id, "quantity": 40})
+    address = authorized_client(customer).post("/shipping-addresses/", json={
+        "street": "123 Test St", "city": "Test City", "state": "Test State", "country": "Test Country", "postal_code": "12345",
+    }).json()
+    order = authorized_client(customer).post("/orders/", json={"shipping_address_id": address["id"]}).json()
+    assert authorized_client(customer).get(f"/products/{shirt.id}").json()["stock"] == 60
+    assert sum(shard_stocks(session, shirt.id)) == 60
+    assert session.get(models.Product, shirt.id).stock == 0
+
+    assert crud.rebalance_stock_shards(session) == 3
+    assert shard_stocks(session, shirt.id) == [20, 20, 20]
+
+    authorized_client(customer).patch(f"/orders/{order['id']}/cancel")
+    assert sum(shard_stocks(session, shirt.id)) == 100
+
+    # Setting the stock spreads it; unsharding folds it back into the row
+    assert authorized_client(admin).put(f"/products/{shirt.id}", json={"stock": 10}).json()["stock"] == 10
+    assert shard_stocks(session, shirt.id) == [4, 3, 3]
+    res = authorized_client(admin).put(f"/products/{shirt.id}/stock-shards", json={"shards": 0})
+    assert (res.json()["stock"], res.json()["stock_shards"]) == (10, 0)
+    assert shard_stocks(session, shirt.id) == []
+
+
+def test_concurrent_checkouts_of_a_sharded_product_do_not_oversell(session, test_product_user):
+    product = models.Product(name="Hot", price=10, stock=9, category="Hot", brand="Hot", owner_id=test_product_user['id'])
+    session.add(product)
+    customers = []
+    for i in range(12):
+        user = models.User(user_name=f"Buyer {i}", email=f"buyer{i}@test.com", phone_number=f"9{i:09d}",
+                           password="x", role=models.UserRole.CUSTOMER)
+        address = models.ShippingAddress(user=user, street="1 St", city="City", state="State",
+                                         postal_code="12345", country="Country")
+        # Two units each, more than some shards will hold
+        session.add(models.CartItem(cart=models.Cart(user=user), product=product, quantity=2))
+        session.add(address)
+        customers.append((user, address))
+    session.commit()
+    crud.shard_stock(session, product.id, 4)
+    session.commit()
+    checkouts = [(user.id, address.id) for user, address in customers]
+
+    def checkout(args):
+        user_id, address_id = args
+        db = TestingSessionLocal()
+        try:
+            cart = crud.get_cart(db, user_id)
+            crud.create_order(db, user_id, address_id, cart.items)
+            return True
+        except ValueError:
+            return False
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        placed = list(pool.map(checkout, checkouts))
+
+    # 9 units: four orders of two, and the last unit can't make a fifth
+    assert placed.count(True) == 4
+    assert sum(shard_stocks(session, product.id)) == 1
+    assert session.query(models.OrderItem).count() == 4
+
+
+def test_decrement_stock_shortfall_leaves_stock_untouched(session, test_product):
+    shirt, headphones = test_product
+    crud.shard_stock(session, headphones.id, 2)
+    session.commit()
+
+    # The shirt's row is decremented before the other product falls short
+    with pytest.raises(crud.InsufficientStock):
+        crud.decrement_stock(session, {shirt.id: 10, headphones.id: 60})
+    with pytest.raises(crud.InsufficientStock):
+        crud.decrement_stock(session, {shirt.id: 10, 9999: 1})
+    assert crud.decrement_stock(session, {shirt.id: 1}) == {shirt.id: 99}
+    session.commit()
+    session.expire_all()
+    assert session.get(models.Product, shirt.id).stock == 99
+    assert shard_stocks(session, headphones.id) == [25, 25]
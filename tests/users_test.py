@@ -1,6 +1,6 @@
 import pytest
 from jose import jwt
-from app import schemas
+from app import schemas, utils
 
 from app.config import settings
 
@@ -53,3 +53,19 @@ def test_incorrect_login(test_user, client, email, password, status_code):
     
     
 
+
+def test_login_fails_fast_when_hashing_pool_is_saturated(test_product_user, client, monkeypatch):
+    monkeypatch.setattr(utils.hashing_pool, "max_pending", 0)
+    res = client.post(
+        "/login", data={"username": test_product_user['email'], "password": test_product_user['password']})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+    assert utils.hashing_pool.stats()["rejected"] > 0
+
+def test_hashing_metrics_admin_only(authorized_client, test_user):
+    res = authorized_client(test_user("CUSTOMER")).get("/metrics/hashing")
+    assert res.status_code == 403
+
+    res = authorized_client(test_user("ADMIN")).get("/metrics/hashing")
+    assert res.status_code == 200
+    assert {"in_flight", "queue_depth", "rejected"} <= res.json().keys()